@@ -0,0 +1,59 @@
+import numpy as np
+import networkx as nx
+
+
+def gather(indptr:np.ndarray, indices:np.ndarray, rows:np.ndarray) -> np.ndarray:
+    """indices[indptr[r]:indptr[r+1]] for every r in rows, concatenated, without a Python loop"""
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return indices[:0]
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+    return indices[offsets]
+
+
+class Adjacency:
+    """A read-only snapshot of a graph's adjacency, for the path engine's traversals, which ignore edge direction.
+
+    Node ids are interned to integer indexes and each connected (u, v) pair,
+    without keys, attributes or self-loops, is kept in parallel src/dst arrays.
+    CSR adjacency over both directions is built from them on first use."""
+
+    def __init__(self, ids:list, src:np.ndarray, dst:np.ndarray):
+        self.ids = ids
+        self.index = { n: i for i, n in enumerate(ids) }
+        self.src = src
+        self.dst = dst
+        self._csr = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, node):
+        return node in self.index
+
+    def csr(self) -> tuple:
+        """(indptr, neighbors) over the undirected view, each neighbor listed once"""
+        if self._csr is None:
+            n = len(self.ids)
+            pairs = np.unique(np.concatenate([self.src, self.dst]).astype(np.int64) * n + np.concatenate([self.dst, self.src]))
+            rows, cols = np.divmod(pairs, n)
+            indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+            self._csr = (indptr, cols.astype(np.int32))
+        return self._csr
+
+    @classmethod
+    def from_networkx(cls, G:nx.Graph) -> "Adjacency":
+        """Parallel edges are taken once, as one (u, v) pair"""
+        ids = list(G.nodes())
+        index = { n: i for i, n in enumerate(ids) }
+        src, dst = [], []
+        for u, neighbors in G.adj.items():
+            i = index[u]
+            for v in neighbors:
+                if v != u:
+                    src.append(i)
+                    dst.append(index[v])
+        return cls(ids, np.array(src, dtype=np.int32), np.array(dst, dtype=np.int32))
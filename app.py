@@ -9,15 +9,23 @@ from shinywidgets import output_widget, render_widget
 from shiny.types import FileInfo
 from htmltools import TagList, div
 from qng import GraphSchema, NodeFactory, LinkFactory, GraphFactory, SigmaFactory, Element, QNG
+from expansion import ExpansionEngine
+from components import ComponentIndex
+from tables import TableModel
+from delta import GraphDelta, DeltaLog
+from cache import ArtifactCache
+from layout import LayoutJob
+from display import DisplayGraph
 
 # def download_handler():
 #     return file_buffer()
 
-def load_schema(filename:str):
+def load_schema(filename:str) -> GraphFactory:
+    """Read a .qngs file and compile it into a GraphFactory"""
     with open(filename, 'r') as f:
-        return msgspec.json.decode(f.read(), type=GraphSchema)
+        return msgspec.json.decode(f.read(), type=GraphSchema).compile()
 
-gs = {
+gfs = {
     "address":  load_schema('graph_schemas/address.qngs'),
     "name":     load_schema('graph_schemas/name.qngs'),
     "company":  load_schema('graph_schemas/company.qngs'),
@@ -25,12 +33,6 @@ gs = {
     "rsxa-ify5": load_schema('graph_schemas/rsxa-ify5 city_contracts.qngs')
 }
 
-gfs = {}
-for key in gs.keys():
-    gf_nf = list(dict(gs[key].node_factories).values())
-    gf_lf = gs[key].link_factories
-    gfs[key] = GraphFactory(node_factories=gf_nf, link_factories=gf_lf)
-
 def help_link(id:str):
      return ui.input_action_link(id, ui.HTML('<i class="fa fa-question-circle" aria-hidden="true"></i>') )
 
@@ -41,7 +43,7 @@ help_text = {
                     ui.tags.p("Click a node on the graph or select some from the dropdown. The subgraph is anything connected to your selection."),
                     ui.tags.p("Preview to confirm it's what you want. Then you can delete it, or keep it and delete everything else.")
                 ),
-    "simple_paths": "Choose a starting point and and ending point and click 'Show' to see only nodes and edges that connect them. Click 'Clear' to return to the full graph.",
+    "simple_paths": "Choose a starting point and and ending point and click 'Show' to see only nodes and edges that connect them. Click 'Clear' to return to the full graph. Set 'Max steps' to ignore longer paths, or 'Paths' to see that many of the shortest routes, including ones longer than the shortest.",
     "select": ui.TagList(ui.tags.p("Select node(s) by clicking on the graph and/or choosing from the dropdown."), ui.tags.p("Once selected, you can merge them together, remove them, or use them to search for more connections.")),
     "and_directly_connected": "in addition to what you selected, include any nodes directly linked to those nodes.",
     "merge_likely_duplicates": 'automatically merge nodes that are probably the same person/address - ("LASTNAME, FIRSTNAME JR" and "FIRSTNAME LASTNAME JR")',
@@ -152,6 +154,8 @@ app_ui = ui.page_fillable(
                                     ui.layout_columns(
                                         ui.input_select("path_start", "Start", choices = []),
                                         ui.input_select("path_end", "End", choices = []),
+                                        ui.input_numeric("path_max_length", "Max steps", value=None, min=1),
+                                        ui.input_numeric("path_count", "Paths (blank for every shortest)", value=None, min=1),
                                     col_widths=(6,6)
                                     ),
                                     ui.card_footer(
@@ -185,6 +189,14 @@ app_ui = ui.page_fillable(
                 ),
             ),
             ui.accordion_panel("Table view", 
+                ui.layout_columns(
+                    ui.input_select("table_sort", "Sort by", choices=[]),
+                    ui.input_checkbox("table_descending", "Descending", value=False),
+                    ui.input_select("table_page_size", "Rows", choices=["50", "100", "500"], selected="100"),
+                    ui.input_numeric("table_page", "Page", value=1, min=1),
+                    ui.output_text("table_position"),
+                    col_widths=(3,2,2,2,3)
+                ),
                 ui.navset_card_tab(
                     ui.nav_panel("Overview", 
                         ui.output_data_frame("graph_summary")
@@ -195,6 +207,7 @@ app_ui = ui.page_fillable(
                     ui.nav_panel("Links",
                         ui.output_data_frame("graph_edges")
                     ),
+                    id="table_tabs"
                 )
                                
             ), 
@@ -213,36 +226,123 @@ def server(input, output, session):
     ### System State         
     entities = reactive.value([])
     all_entities = reactive.value([])  
+    # the session graph is one object, changed in place through change_graph
     G = reactive.value(nx.MultiDiGraph())
+    graph_version = reactive.value(0)
+    graph_deltas = DeltaLog()
+    seen_versions = {}
+    # anything derived from G is made once per graph version
+    artifacts = ArtifactCache()
     nodes = reactive.value({})
     build_count = reactive.value(0)
     merged = reactive.value([])
-    connected_nodes = reactive.value({})
+    connected_nodes = reactive.value(set())
+    tidy_index = DuplicateIndex()
+    components = ComponentIndex()
+    tables = TableModel()
+    node_names = NodeNames()
+    graph_types = GraphTypes()
+    display = DisplayGraph()
     
     ### Factories
     SF = reactive.value(SigmaFactory(clickable_edges=True))
     viz = reactive.value()
+    # the last layout worked out here, where the widget has none to offer
+    server_layout = {}
+    # what the widget in viz was made to show, so an unchanged view isn't made again
+    showing = {"view": None}
     
+    ### Tables are only built while the Table view is open, and only for the tab showing
+    table_names = {"Overview": "overview", "Nodes": "nodes", "Links": "edges"}
+
+    def shown_table(tab:str) -> bool:
+        return "Table view" in (input.accordion_controls() or ()) and input.table_tabs() == tab
+
+    def table_page(tab:str):
+        # G is changed in place, so its version is what tells a render the graph changed
+        graph_version()
+        if not shown_table(tab) or len(G()) == 0:
+            return None
+        follow("tables", tables)
+        return tables.page(
+            table_names[tab],
+            input.table_page() or 1,
+            int(input.table_page_size()),
+            sort_by=input.table_sort() or None,
+            descending=input.table_descending()
+        )
+
     @render.data_frame
     def graph_nodes():
-        if len(G()) > 0:
-            return render.DataGrid(get_node_frame(G()), width="100%")
+        page = table_page("Nodes")
+        if page is not None:
+            return render.DataGrid(page[0], width="100%")
    
     @render.data_frame
     def graph_edges():
-        if len(G()) > 0:
-            return render.DataGrid(get_edge_frame(G()), width="100%")
+        page = table_page("Links")
+        if page is not None:
+            return render.DataGrid(page[0], width="100%")
     
     @render.data_frame
     def graph_summary():
-        if len(G()) > 0: 
-            return render.DataGrid(get_overview_frame(G()), width="100%")
+        page = table_page("Overview")
+        if page is not None:
+            return render.DataGrid(page[0], width="100%")
+
+    @render.text
+    def table_position():
+        tab = input.table_tabs()
+        page = table_page(tab) if tab in table_names else None
+        if page is None or page[1] == 0:
+            return ""
+        rows, total = page
+        start = ((input.table_page() or 1) - 1) * int(input.table_page_size())
+        return f"{start + 1:,}-{start + len(rows):,} of {total:,}"
+
+    @reactive.effect
+    @reactive.event(input.accordion_controls, input.table_tabs, graph_version)
+    def _():
+        tab = input.table_tabs()
+        if not shown_table(tab) or len(G()) == 0:
+            return
+        follow("tables", tables)
+        columns = tables.columns(table_names[tab])
+        current = input.table_sort()
+        ui.update_select("table_sort", choices=["", *columns], selected=current if current in columns else "")
+
+    @reactive.effect
+    @reactive.event(input.table_tabs, input.table_sort, input.table_descending, input.table_page_size)
+    def _():
+        ui.update_numeric("table_page", value=1)
     
+    def change_graph(change) -> GraphDelta:
+        """Run change(G()), which changes the session graph in place and returns the
+        GraphDelta it made. The delta is logged and the graph version goes up, which
+        is what effects that follow the graph react to."""
+        delta = change(G())
+        if not delta.is_empty():
+            graph_version.set(graph_deltas.append(delta))
+        return delta
+
+    def graph_changes(follower:str) -> GraphDelta | None:
+        """What changed since follower last asked, or None if it's too far behind and has to start over"""
+        delta = graph_deltas.since(seen_versions.get(follower, 0))
+        seen_versions[follower] = graph_deltas.version
+        return delta
+
+    def follow(follower:str, index):
+        """Bring an index with apply(G, delta) and rebuild(G) up to date with the session graph"""
+        delta = graph_changes(follower)
+        if delta is None:
+            index.rebuild(G())
+        elif not delta.is_empty():
+            index.apply(G(), delta)
+
     def get_connected_to_selected():
         selected = get_selected_nodes()
-        connected = {}
-        for s in selected:
-            connected.update(get_connected_nodes(G(), s, connected))
+        follow("components", components)
+        connected = components.connected(selected)
         # connected_nodes.set(connected)
         return connected 
     
@@ -255,23 +355,7 @@ def server(input, output, session):
     @ui.bind_task_button(button_id = 'search_btn')
     @reactive.extended_task
     async def search(name_search:str, addr_search:str, file_number_search:str) -> list:
-
-        print("retrieving ids")
-        name_ids = get_name_ids(name_search) if len(name_search) > 0 else []
-        address_ids = get_address_ids(addr_search) if len(addr_search) > 0 else []
-        print(name_ids, address_ids)    
-        
-        print("retrieving entities")
-        name_entities = get_entities('name_id', name_ids)
-        addr_entities = get_entities('address_id', address_ids)
-        file_numbers = [e.file_number for e in name_entities] + [e.file_number for e in addr_entities]
-        
-        fn_entities = get_entities_by_file_number(file_number_search) if len(file_number_search) > 0 else []
-        fn_entities += get_entities("file_number", file_numbers)
-        
-        combined = combine_entitity_list([name_entities, addr_entities, fn_entities])
-        print("entities:", len(combined))
-        return combined 
+        return await asyncio.to_thread(search_entities, name_search, addr_search, file_number_search)
 
     @reactive.effect
     @reactive.event(search.result)
@@ -295,10 +379,10 @@ def server(input, output, session):
     @reactive.event(entities, search.result)
     def build_graph():
         print("building graph")
-        graph = graph_entities(G().copy(), gfs, entities(), merged())
+        delta = change_graph(lambda graph: graph_entities(graph, gfs, entities(), merged()))
+        print(f"added {len(delta.nodes_added)} nodes and {len(delta.edges_added)} edges")
         
-        if len(graph) > 0:
-            G.set(graph)
+        if len(G()) > 0:
             builds = build_count() + 1
             build_count.set(builds)
         
@@ -320,10 +404,7 @@ def server(input, output, session):
                         mg.nodes[node]['label'] = node.upper()
                     
                 print(len(mg))
-                if len(G()) > 0:
-                    G.set(nx.compose(G(), mg))
-                else:
-                    G.set(mg)
+                change_graph(lambda graph: add_graph(graph, mg))
 
                 build_count.set(build_count() + 1)
 
@@ -354,9 +435,13 @@ def server(input, output, session):
                     node_color_palette = None, 
                     node_color = lambda n: "selected" if n in connected else "not selected"
                 )
-                layout = viz().get_layout()
-                camera_state = viz().get_camera_state()
-                viz.set(selected_SF.make_sigma(G(), node_colors="Dark2", layout=layout, camera_state=camera_state))
+                view = ("preview", graph_version(), frozenset(connected))
+                if showing["view"] != view:
+                    follow("display", display)
+                    layout = current_layout()
+                    camera_state = viz().get_camera_state()
+                    viz.set(selected_SF.make_sigma(display.graph, node_colors="Dark2", layout=layout, camera_state=camera_state, start_layout=False))
+                    showing["view"] = view
             else:
                 m = get_modal(
                     title="You didn't select anything",
@@ -372,8 +457,7 @@ def server(input, output, session):
         connected = get_connected_to_selected()
         if len(connected) == 0 and len(connected_nodes()) > 0:
             connected = connected_nodes()
-        graph = nx.induced_subgraph(G(), connected)
-        G.set(graph)
+        change_graph(lambda graph: remove_nodes(graph, [ n for n in graph if n not in connected ]))
         
     
     @reactive.effect
@@ -382,15 +466,13 @@ def server(input, output, session):
         connected = get_connected_to_selected()
         if len(connected) == 0 and len(connected_nodes()) > 0:
             connected = connected_nodes()
-        graph = G().copy()
-        graph.remove_nodes_from(connected)
-        G.set(graph)
+        change_graph(lambda graph: remove_nodes(graph, connected))
         
     @reactive.effect
     @reactive.event(input.cancel_subgraph, input.clear_paths)
     def _():
-        graph = G().copy()
-        G.set(graph)
+        # the graph hasn't changed, only the widget showing a preview or paths
+        draw_graph()
         
     
     # Show Simple Paths
@@ -398,8 +480,18 @@ def server(input, output, session):
     @reactive.event(input.show_paths)        
     def _():
         print("generating path graph")
-        PG = path_graph = get_path_graph(G(), input.path_start(), input.path_end())
-        viz.set(SF().make_sigma(PG))
+        follow("display", display)
+        PG, result = get_path_graph(display.graph, input.path_start(), input.path_end(), k=input.path_count(), max_length=input.path_max_length(), version=graph_version())
+        if result.truncated or len(result.nodes) == 0:
+            m = get_modal(
+                title = "Showing part of the paths" if result.truncated else "No paths found",
+                prompt = result.reason,
+                buttons = [ui.modal_button("OK")]
+            )
+            ui.modal_show(m)
+        if len(result.nodes) > 0:
+            viz.set(SF().make_sigma(PG))
+            showing["view"] = ("paths", graph_version())
 
             
 
@@ -428,10 +520,11 @@ def server(input, output, session):
             return []
     
     # Update node list 
-    def update_node_choices(graph):
-        node_names = get_node_names(graph)
-        nodes.set(node_names)
-        choices = {node_names[n]: n for n in sorted(list(node_names.keys()))}
+    def update_node_choices():
+        follow("node names", node_names)
+        names = node_names.names()
+        nodes.set(names)
+        choices = {names[n]: n for n in sorted(list(names.keys()))}
         # choices = sorted(list(nodes().keys()))
         ui.update_selectize("selected_nodes", choices= choices)
         ui.update_select("path_start", choices=choices)
@@ -442,9 +535,8 @@ def server(input, output, session):
     @reactive.effect
     @reactive.event(input.remove)
     def _():
-        graph = G().copy()
-        graph.remove_nodes_from(get_selected_nodes())
-        G.set(graph)
+        selected = get_selected_nodes()
+        change_graph(lambda graph: remove_nodes(graph, selected))
     
     
     ### Combine selected nodes
@@ -454,10 +546,8 @@ def server(input, output, session):
         
         selected = get_selected_nodes()
         print("Combining nodes: ", selected)
-        new_graph = combine_nodes(G(), selected)
-        
         merged.set( merged() + [selected])    
-        G.set(new_graph)
+        change_graph(lambda graph: GraphDelta(merges=combine_node_groups(graph, [selected])))
 
     
     
@@ -502,9 +592,7 @@ def server(input, output, session):
     def _():
         ui.modal_remove()
         resource_id = 'rsxa-ify5'
-        records = search_contracts.result().to_dict('records')
-        graph = nx.compose(G(), gfs[resource_id].make_graphs([ row for row in records], "data.cityofchicago.org"))
-        G.set(graph)
+        change_graph(lambda graph: gfs[resource_id].add_to_graph(graph, search_contracts.result(), "data.cityofchicago.org", excluded_pattern))
                 
         
         
@@ -523,18 +611,19 @@ def server(input, output, session):
             )
             ui.modal_show(m)
         else:
-            expand(G(), selected)
+            expand(get_alias_ids(G(), selected))
     
     @reactive.effect
     @reactive.event(input.expand_all)
     def _():
         ui.modal_remove()
-        expand(G(), [])        
+        expand(get_alias_ids(G(), list(G().nodes())))
 
     @ui.bind_task_button(button_id='expand_btn')
     @reactive.extended_task
-    async def expand(graph: nx.MultiGraph, selected_nodes:list = []):
-        return expand_graph(graph, selected_nodes) 
+    async def expand(node_ids:list):
+        # ids are read off the graph here, so the worker never sees it while it changes
+        return await asyncio.to_thread(ExpansionEngine().expand, node_ids)
         
     @reactive.effect
     @reactive.event(expand.result) 
@@ -544,39 +633,78 @@ def server(input, output, session):
         entities.set(new_entities)
 
     @reactive.effect
+    @reactive.event(graph_version)
     def _():
-        update_node_choices(G())
+        update_node_choices()
     
 
 
         
     # Tidy up
     @reactive.effect
-    @reactive.event(G, build_count, input.tidy)
+    @reactive.event(graph_version, build_count, input.tidy)
     def _():
         print(input.tidy(), len(G()))
+        changes = graph_changes("tidy")
+        # only nodes that are new or changed since the last tidy can have become duplicates
+        nodes = None if changes is None else [ *changes.nodes_added, *changes.nodes_updated, *(k for k, _ in changes.merges) ]
 
-        if input.tidy() is True and len(G()) > 0:
-            graph = tidy_up(G())
-        elif len(G()) > 0: 
-            graph = tidy_up_companies(G())
-        else: 
-            graph = G()
-        G.set(graph)
+        def tidy(graph):
+            delta = GraphDelta()
+            tidy_graph(graph, tidy_index, everything=input.tidy() is True, delta=delta, nodes=nodes)
+            return delta
+
+        if len(G()) > 0:
+            change_graph(tidy)
         
 
-    # Make graph widget
+    # Lay out the graph, starting from where its nodes already are
+    def current_layout() -> dict:
+        try:
+            layout = viz().get_layout()
+        except Exception as e:
+            layout = None
+        return server_layout if layout is None else layout
+
     @reactive.effect
-    @reactive.event(G) 
+    @reactive.event(graph_version) 
     def _():
-        node_colors, edge_colors = get_colors(G())
+        lay_out(LayoutJob(G(), current_layout(), graph_version()))
+
+    @reactive.extended_task
+    async def lay_out(job:LayoutJob):
+        return job.version, await asyncio.to_thread(job.run)
+
+    @reactive.effect
+    @reactive.event(lay_out.result)
+    def _():
+        version, layout = lay_out.result()
+        server_layout.clear()
+        server_layout.update(layout)
+        # a layout for a graph that has changed since is only a starting point for the next one,
+        # and a preview or paths opened since it started stay up
+        view = showing["view"]
+        if version == graph_version() and (view is None or view[0] == "graph" or view[1] != version):
+            draw_graph(layout)
+
+    # Make graph widget
+    def draw_graph(layout:dict|None = None):
+        """Show the session graph. Without a new layout, a widget already showing this version of it is kept."""
+        view = ("graph", graph_version())
+        if layout is None and showing["view"] == view:
+            return
+        follow("types", graph_types)
+        follow("display", display)
+        node_colors, edge_colors = artifacts.get(graph_version(), "colors", graph_types.colors)
+        if layout is None:
+            # every node needs a position, including any added since the last layout
+            layout = LayoutJob(G(), current_layout()).run(iterations=0)
         try:
-            layout = viz().get_layout()
             camera_state = viz().get_camera_state()
-            viz.set(SF().make_sigma(G(), node_colors, edge_colors, layout = layout, camera_state = camera_state))
         except Exception as e:
-            print(e)
-            viz.set(SF().make_sigma(G(), node_colors, edge_colors))
+            camera_state = {}
+        viz.set(SF().make_sigma(display.graph, node_colors, edge_colors, layout = layout, camera_state = camera_state, start_layout = False))
+        showing["view"] = view
         
         
     # Update visualization
@@ -586,6 +714,9 @@ def server(input, output, session):
     
     @render.download(filename="graph_export.html")
     def export_graph():
+        yield artifacts.get(graph_version(), "html", make_html)
+
+    def make_html() -> bytes:
         with io.BytesIO() as bytes_buf:
             with io.TextIOWrapper(bytes_buf) as text_buf:
                 Sigma.write_html(
@@ -614,7 +745,8 @@ def server(input, output, session):
                     show_all_labels=True if len(G()) < 100 else False,
                     start_layout= len(G()) / 10
                 )
-                yield bytes_buf.getvalue()
+                text_buf.flush()
+                return bytes_buf.getvalue()
 
     @render.download(filename="entities_export.csv" )
     def export_entities():        
@@ -633,20 +765,27 @@ def server(input, output, session):
         # no_data_source = get_nodes_by_attribute(G(), "data_source", None)
         # for node in no_data_source:
         #     G().nodes[node]['data_source'] = "il_sos"
-            
-        adj = nx.to_dict_of_dicts(G())
-        attrs = { n: G().nodes[n] for n in G().nodes()}
-        qng = QNG(adjacency=adj, node_attrs=attrs, sigma_factory=SF())
-        yield msgspec.json.encode(qng)
+        sigma_factory = SF()
+        yield artifacts.get(graph_version(), ("qng", id(sigma_factory)), lambda: make_qng(G(), sigma_factory))
+
+    def make_qng(graph, sigma_factory) -> bytes:
+        adj = nx.to_dict_of_dicts(graph)
+        attrs = { n: graph.nodes[n] for n in graph.nodes()}
+        qng = QNG(adjacency=adj, node_attrs=attrs, sigma_factory=sigma_factory)
+        return msgspec.json.encode(qng)
 
 
     @render.download(filename="graph_tables.xlsx" )
     def export_xlsx():        
+        yield artifacts.get(graph_version(), "xlsx", make_xlsx)
+
+    def make_xlsx() -> bytes:
+        follow("tables", tables)
         with io.BytesIO() as buf:
             with pd.ExcelWriter(buf, engine='xlsxwriter') as writer:
-                export_sheet(get_overview_frame(G()), writer, "Summary")
-                export_sheet(get_edge_frame(G()), writer, "Links")
-                export_sheet(get_node_frame(G()), writer, "Nodes")
-            yield buf.getvalue()
+                export_sheet(tables.overview_frame(), writer, "Summary")
+                export_sheet(tables.edge_frame(), writer, "Links")
+                export_sheet(tables.node_frame(), writer, "Nodes")
+            return buf.getvalue()
 
 app = App(app_ui, server)
\ No newline at end of file
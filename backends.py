@@ -0,0 +1,76 @@
+import json
+import msgspec
+from urllib.parse import quote
+from business_class import Entity
+from fetch import paginate, run_concurrently
+
+# stay well under the URL limits of the server and anything in front of it
+max_url_bytes = 6000
+
+
+def chunk_values(values:list, max_bytes:int) -> list:
+    """Split values into lists whose url-encoded json form fits in max_bytes"""
+    chunks = []
+    chunk = []
+    size = len(quote("[]"))
+    separator = len(quote(", "))
+    for v in values:
+        item = len(quote(json.dumps(v)))
+        if len(chunk) > 0 and size + separator + item > max_bytes:
+            chunks.append(chunk)
+            chunk = []
+            size = len(quote("[]"))
+        size += item + (separator if len(chunk) > 0 else 0)
+        chunk.append(v)
+    if len(chunk) > 0:
+        chunks.append(chunk)
+    return chunks
+
+
+class IdRow(msgspec.Struct, gc=False):
+    id: int
+
+
+def unique_entities(pages:list) -> list:
+    # chunks can overlap on shared entities, so keep the first copy of each one
+    seen = set()
+    entities = []
+    for page in pages:
+        for e in page:
+            if e.id not in seen:
+                seen.add(e.id)
+                entities.append(e)
+    return entities
+
+
+class DatasetteBackend:
+    """Answers entity/name/address queries from the companies datasette.
+
+    Every backend returns entities as business_class.Entity and ids as plain lists."""
+
+    def __init__(self, endpoint:str):
+        self.endpoint = endpoint
+
+    def entities_in(self, field:str, values:list, company_only:bool = False, page_size = None) -> list:
+        """Splits long id lists into several requests that run in parallel.
+        page_size can be a number or "max"."""
+        base = f"{self.endpoint}/companies/entities.json?_labels=on&_shape=array"
+        if company_only:
+            base += "&type__exact=company"
+        if page_size is not None:
+            base += f"&_size={page_size}"
+        prefix = f"{base}&{field}__in="
+        chunks = chunk_values(values, max_url_bytes - len(quote(prefix, safe=":/?&=_.-")))
+        pages = run_concurrently([ lambda c=c: paginate(prefix + json.dumps(c), Entity) for c in chunks ])
+        return unique_entities(pages)
+
+    def entities_like(self, field:str, pattern:str) -> list:
+        return paginate(f"{self.endpoint}/companies/entities.json?_labels=on&_shape=array&{field}__like={pattern}", Entity)
+
+    def name_ids(self, pattern:str) -> list:
+        data = paginate(f"{self.endpoint}/companies/names.json?_shape=array&name__like={pattern}", IdRow)
+        return [d.id for d in data]
+
+    def address_ids(self, pattern:str) -> list:
+        data = paginate(f"{self.endpoint}/companies/addresses.json?_shape=array&street__like={pattern}", IdRow)
+        return [d.id for d in data]
@@ -0,0 +1,65 @@
+"""Rows per second through each graph schema, interpreted vs compiled.
+
+    python bench_schemas.py [rows]
+"""
+import glob
+import random
+import sys
+import time
+import msgspec
+from qng import GraphFactory, GraphSchema
+
+
+def entity_row(i:int) -> dict:
+    return {
+        "id": i,
+        "file_number": f"LLC{i:08d}",
+        "type": random.choice(["company", "manager", "agent", "president"]),
+        "name_id": f"N{random.randrange(100_000)}",
+        "name": f"NAME {random.randrange(100_000)} LLC",
+        "address_id": f"A{random.randrange(100_000)}",
+        "address": f"{random.randrange(9999)} W MAIN ST",
+        "dg_type": "entity",
+    }
+
+
+def contract_row(i:int) -> dict:
+    return {
+        "result_id": f"R{i}",
+        "department": random.choice(["DEPT OF FINANCE", "DEPT OF AVIATION", "DEPT OF WATER"]),
+        "vendor_name": f"VENDOR {random.randrange(5_000)}",
+        "node_id": f"{random.randrange(9999)} W MAIN ST",
+        "address_1": f"{random.randrange(9999)} W MAIN ST",
+        "award_amount": random.choice([f"{random.randrange(10**6)}.00", None, "see pdf"]),
+        "approval_date": "2023-01-01T00:00:00.000",
+        "contract_pdf": None,
+        "purchase_order_description": "SERVICES",
+    }
+
+
+def rows_per_second(gf:GraphFactory, rows:list, repeat:int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        gf.collect(rows, "bench")
+        best = min(best, time.perf_counter() - start)
+    return len(rows) / best
+
+
+def main(n:int):
+    random.seed(0)
+    for filename in sorted(glob.glob("graph_schemas/*.qngs")):
+        with open(filename) as f:
+            schema = msgspec.json.decode(f.read(), type=GraphSchema)
+        make_row = contract_row if "contracts" in filename else entity_row
+        rows = [ make_row(i) for i in range(n) ]
+        interpreted = GraphFactory(node_factories=list(schema.node_factories.values()), link_factories=schema.link_factories)
+        compiled = schema.compile()
+        assert interpreted.collect(rows, "bench") == compiled.collect(rows, "bench"), filename
+        before = rows_per_second(interpreted, rows)
+        after = rows_per_second(compiled, rows)
+        print(f"{filename:45} {before:>12,.0f} {after:>12,.0f} rows/s  x{after / before:.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
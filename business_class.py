@@ -1,29 +1,32 @@
 import msgspec 
 
-class ForeignKey(msgspec.Struct):
-    label: str 
+class ForeignKey(msgspec.Struct, gc=False):
     value: int         
+    label: str | None = None
 
-class Entity(msgspec.Struct):
+class Entity(msgspec.Struct, gc=False):
     """A person or company with some relationship to a specific company"""
     id: int 
     file_number : str 
     type : str 
-    name_id : ForeignKey
-    address_id : ForeignKey 
+    name_id : ForeignKey | None = None
+    address_id : ForeignKey | None = None
                 
     def link_dict(self):
         prohibited_links = ["SAME"]
+        name_id = self.name_id
+        address_id = self.address_id
+        linked = name_id is not None and name_id.label not in prohibited_links
         return {
             "id": self.id, 
             "file_number": self.file_number, 
             "type": self.type, 
             "dg_type": self.type,
             "data_source": "il_sos",
-            "name_id": None if self.name_id['label'] in prohibited_links else f"N{self.name_id['value']}",
-            "name": None if self.name_id['label'] in prohibited_links else self.name_id['label'],
-            "address_id": f"A{self.address_id['value']}" if self.address_id else None,
-            "address": self.address_id['label'] if self.address_id else None
+            "name_id": f"N{name_id.value}" if linked else None,
+            "name": name_id.label if linked else None,
+            "address_id": f"A{address_id.value}" if address_id else None,
+            "address": address_id.label if address_id else None
         }
     
     def address_dict(self):
@@ -33,36 +36,36 @@ class Entity(msgspec.Struct):
                 "type": "address", 
                 "dg_type": "address",
                 "data_source": "il_sos",
-                "address_id": f"A{self.address_id['value']}",
-                "address": self.address_id['label']
+                "address_id": f"A{self.address_id.value}",
+                "address": self.address_id.label
             }
         else:
             return {}
         
     def name_dict(self):
         prohibited_names = ["SAME"]
-        if self.name_id['label'] not in prohibited_names:
+        if self.name_id is not None and self.name_id.label not in prohibited_names:
             return {
                     "id": self.id,  
                     "type": "person", 
                     "dg_type": "person",
                     "data_source": "il_sos",
-                    "name_id": f"N{self.name_id['value']}",
-                    "name": self.name_id['label']
+                    "name_id": f"N{self.name_id.value}",
+                    "name": self.name_id.label
                 }
         else:
             return {}
     
     def company_dict(self):
-        if self.type == "company":
+        if self.type == "company" and self.name_id is not None:
             return {
                     "id": self.id, 
                     "file_number": self.file_number, 
                     "type": "company", 
                     "dg_type": "company",
                     "data_source": "il_sos",
-                    "name_id": f"N{self.name_id['value']}",
-                    "name": self.name_id['label']
+                    "name_id": f"N{self.name_id.value}",
+                    "name": self.name_id.label
                 }
         else:
             return {}
@@ -70,11 +73,11 @@ class Entity(msgspec.Struct):
         
     def label(self): 
         if self.name_id:
-            return getattr(self, 'name_id')['label']
+            return self.name_id.label
     
     def simplify(self):
-        name = self.name_id['label'] if self.name_id else ""
-        address = self.address_id['label'] if self.address_id else ""
+        name = self.name_id.label if self.name_id else ""
+        address = self.address_id.label if self.address_id else ""
         td = {
             "id": self.id, 
             "file_number": self.file_number, 
@@ -82,4 +85,4 @@ class Entity(msgspec.Struct):
             "name": name, 
             "address": address
         }
-        return td 
\ No newline at end of file
+        return td 
@@ -0,0 +1,174 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+def normalize_url(url: str) -> str:
+    """The same query written with its parameters in a different order should share a cache entry"""
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
+
+
+class ResponseCache:
+    """A SQLite-backed byte cache with a per-entry TTL and a total size cap.
+    When the cap is exceeded the least recently used entries are evicted."""
+
+    def __init__(self, path: str, ttl: float | None = 24 * 60 * 60, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:" and os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires REAL,
+                accessed REAL NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> bytes | None:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, size, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, size, expires = row
+            if expires is not None and expires <= now:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float | None = -1):
+        ttl = self.ttl if ttl == -1 else ttl
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        expires = None if ttl is None else now + ttl
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, expires, now)
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # another process may share the file, so recount before deciding how much to drop
+        self.total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self._db.execute("DELETE FROM responses WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+        self.total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        while self.total_bytes > self.max_bytes:
+            rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 64").fetchall()
+            if len(rows) == 0:
+                break
+            for key, size in rows:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self.total_bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+            "evictions": self.evictions,
+            "bytes": self.total_bytes,
+        }
+
+
+class LRUCache:
+    """A bounded in-memory mapping that forgets the least recently used keys first"""
+
+    def __init__(self, maxsize: int = 50_000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+            "size": len(self._data),
+        }
+
+
+class ArtifactCache:
+    """Things derived from a versioned object, kept only for the version they were made from"""
+
+    def __init__(self):
+        self.version = None
+        self.items = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, name, make):
+        if version != self.version:
+            self.version = version
+            self.items = {}
+        if name in self.items:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.items[name] = make()
+        return self.items[name]
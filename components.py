@@ -0,0 +1,113 @@
+import networkx as nx
+from delta import GraphDelta
+
+
+class ComponentIndex:
+    """Which connected component each node of a graph is in, ignoring edge direction.
+
+    Components are labeled sets. Added edges join the smaller set into the
+    larger one, merged nodes join their keep node's component, and removals
+    only re-walk what is left of the components they touched, so nothing is
+    recomputed for the rest of the graph."""
+
+    def __init__(self):
+        self.label = {}
+        self.members = {}
+        self.next_label = 0
+
+    def __len__(self):
+        return len(self.label)
+
+    def __contains__(self, node):
+        return node in self.label
+
+    def new_component(self, nodes) -> int:
+        label = self.next_label
+        self.next_label += 1
+        self.members[label] = set(nodes)
+        for n in self.members[label]:
+            self.label[n] = label
+        return label
+
+    def rebuild(self, G):
+        self.label = {}
+        self.members = {}
+        for component in nx.connected_components(G.to_undirected(as_view=True)):
+            self.new_component(component)
+
+    def add_node(self, node):
+        if node not in self.label:
+            self.new_component([node])
+
+    def union(self, a, b):
+        self.add_node(a)
+        self.add_node(b)
+        keep, other = self.label[a], self.label[b]
+        if keep == other:
+            return
+        if len(self.members[keep]) < len(self.members[other]):
+            keep, other = other, keep
+        moved = self.members.pop(other)
+        for n in moved:
+            self.label[n] = keep
+        self.members[keep] |= moved
+
+    def discard(self, node):
+        label = self.label.pop(node, None)
+        if label is not None:
+            self.members[label].discard(node)
+        return label
+
+    def split(self, G, nodes):
+        """Walk again what is left of the components nodes were in, after nodes or
+        edges of theirs were removed from G. Nodes no longer in G are forgotten."""
+        touched = { self.label[n] for n in nodes if n in self.label }
+        for n in nodes:
+            if n not in G:
+                self.discard(n)
+        graph = G.to_undirected(as_view=True)
+        for label in touched:
+            rest = self.members.pop(label)
+            if len(rest) == 0:
+                continue
+            for component in nx.connected_components(graph.subgraph(rest)):
+                self.new_component(component)
+
+    def remove(self, G, nodes):
+        """Forget nodes that have been removed from G"""
+        self.split(G, nodes)
+
+    def merge(self, merges:list, G = None):
+        """(keep_node, merged_nodes) pairs, as combine_node_groups returns them.
+        Given G, a merged node that has since come back into it is kept."""
+        for keep_node, merged_nodes in merges:
+            self.add_node(keep_node)
+            for n in merged_nodes:
+                if n in self.label:
+                    self.union(keep_node, n)
+                    if G is None or n not in G:
+                        self.discard(n)
+
+    def apply(self, G, delta:GraphDelta):
+        """Catch up with a change that has been applied to G. Additions and merges only
+        ever join components, so they go first; removals then split what they touched."""
+        for n in delta.nodes_added:
+            if n in G:
+                self.add_node(n)
+        for u, v, _ in delta.edges_added:
+            if u in G and v in G:
+                self.union(u, v)
+        self.merge(delta.merges, G)
+        # a merged node that came back may have been joined to its old keep node
+        returned = [ n for _, merged_nodes in delta.merges for n in merged_nodes if n in G ]
+        self.split(G, [ *delta.nodes_removed, *returned ])
+
+    def component(self, node) -> set:
+        return self.members[self.label[node]] if node in self.label else set()
+
+    def connected(self, nodes) -> set:
+        """Every node that can reach any of nodes"""
+        connected = set()
+        for label in { self.label[n] for n in nodes if n in self.label }:
+            connected |= self.members[label]
+        return connected
@@ -0,0 +1,100 @@
+class DisjointSet:
+    """Union-find over hashable items, with path halving and union by size"""
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def __contains__(self, item):
+        return item in self.parent
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        root_a = self.find(a)
+        root_b = self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a
+
+    def groups(self, min_size:int = 2) -> list:
+        members = {}
+        for item in self.parent:
+            members.setdefault(self.find(item), []).append(item)
+        return [m for m in members.values() if len(m) >= min_size]
+
+
+class DuplicateIndex:
+    """Blocking keys per node, kept between tidy passes so only new or relabeled
+    nodes have to be parsed again. Keys are (kind, ...) tuples."""
+
+    def __init__(self):
+        self.signatures = {}
+        self.node_keys = {}
+        self.key_nodes = {}
+        self.kinds = set()
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def is_current(self, node, signature) -> bool:
+        return self.signatures.get(node) == signature
+
+    def set_keys(self, node, signature, keys:list):
+        self.discard(node)
+        self.signatures[node] = signature
+        self.node_keys[node] = keys
+        for key in keys:
+            self.key_nodes.setdefault(key, set()).add(node)
+
+    def discard(self, node):
+        self.signatures.pop(node, None)
+        for key in self.node_keys.pop(node, []):
+            nodes = self.key_nodes.get(key)
+            if nodes is not None:
+                nodes.discard(node)
+                if len(nodes) == 0:
+                    del self.key_nodes[key]
+
+    def groups(self, nodes, kinds:set, exists) -> list:
+        """Duplicate groups reachable from nodes through keys of the given kinds.
+        Nodes that exists() rejects are dropped from the index on the way."""
+        ds = DisjointSet()
+        visited = set()
+        stack = list(nodes)
+        while stack:
+            n = stack.pop()
+            if n in visited:
+                continue
+            visited.add(n)
+            if not exists(n):
+                self.discard(n)
+                continue
+            ds.add(n)
+            for key in self.node_keys.get(n, []):
+                if key[0] not in kinds:
+                    continue
+                for m in list(self.key_nodes.get(key, ())):
+                    if m == n:
+                        continue
+                    if not exists(m):
+                        self.discard(m)
+                        continue
+                    ds.add(m)
+                    ds.union(n, m)
+                    stack.append(m)
+        return ds.groups()
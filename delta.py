@@ -0,0 +1,73 @@
+from collections import deque
+import msgspec
+
+
+class GraphDelta(msgspec.Struct):
+    """What a change did to the session graph. nodes_updated are nodes whose attributes,
+    such as their label, changed in place; merges are (keep_node, merged_nodes) pairs.
+    edges_added name their ends as they are after the change, so an edge whose end
+    was later merged away names the node it was merged into."""
+    nodes_added : list = []
+    nodes_updated : list = []
+    edges_added : list = []
+    nodes_removed : list = []
+    merges : list = []
+
+    def add_merges(self, merges:list):
+        """Record merges made after the rest of this delta, moving the edges it added onto the nodes they now join"""
+        merged_into = { n: keep_node for keep_node, merged_nodes in merges for n in merged_nodes }
+
+        def resolve(n):
+            while n in merged_into:
+                n = merged_into[n]
+            return n
+
+        if len(merged_into) > 0:
+            self.edges_added = [ (resolve(u), resolve(v), key) for u, v, key in self.edges_added ]
+        self.merges += merges
+        return self
+
+    def extend(self, other:"GraphDelta"):
+        self.add_merges(other.merges)
+        added = set(self.nodes_added)
+        self.nodes_added += [n for n in other.nodes_added if n not in added]
+        updated = set(self.nodes_updated)
+        self.nodes_updated += [n for n in other.nodes_updated if n not in updated and n not in added]
+        self.edges_added += other.edges_added
+        self.nodes_removed += other.nodes_removed
+        return self
+
+    def is_empty(self) -> bool:
+        return (
+            len(self.nodes_added) == 0 and len(self.nodes_updated) == 0 and len(self.edges_added) == 0
+            and len(self.nodes_removed) == 0 and len(self.merges) == 0
+        )
+
+
+class DeltaLog:
+    """The deltas a graph has been through, numbered by the version each one made.
+
+    Anything that follows the graph remembers the last version it saw and asks
+    for what changed since, so it can apply just that. Only the latest deltas
+    are kept; a follower further behind than that has to rebuild."""
+
+    def __init__(self, keep:int = 100):
+        self.version = 0
+        self.deltas = deque(maxlen=keep)
+
+    def append(self, delta:GraphDelta) -> int:
+        self.version += 1
+        self.deltas.append((self.version, delta))
+        return self.version
+
+    def since(self, version:int) -> GraphDelta | None:
+        """Every change after version, as one delta, or None if the log no longer reaches back that far"""
+        if version == self.version:
+            return GraphDelta()
+        if version > self.version or len(self.deltas) == 0 or self.deltas[0][0] > version + 1:
+            return None
+        combined = GraphDelta()
+        for v, delta in self.deltas:
+            if v > version:
+                combined.extend(delta)
+        return combined
@@ -0,0 +1,56 @@
+import networkx as nx
+from delta import GraphDelta
+
+# attributes the graph widget has no use for; a merged node's history can outweigh everything else
+hidden_node_attrs = ['contraction', 'merge_data', 'dg_type', 'tidy']
+hidden_edge_attrs = ['contraction']
+
+
+def shown(attrs:dict, hidden:list) -> dict:
+    return { k: x for k, x in attrs.items() if k not in hidden }
+
+
+class DisplayGraph:
+    """The session graph as the graph widget shows it, kept up to date from graph deltas.
+
+    It has the same nodes and edges, without the attributes the widget would only
+    serialize and send to the browser, so a new widget costs what is on screen
+    rather than everything the session graph remembers about each node."""
+
+    def __init__(self):
+        self.graph = nx.MultiDiGraph()
+
+    def rebuild(self, G):
+        self.graph = nx.MultiDiGraph()
+        for n in G.nodes:
+            self.set_node(G, n)
+        for u, v, key, attrs in G.edges(keys=True, data=True):
+            self.graph.add_edge(u, v, key, **shown(attrs, hidden_edge_attrs))
+
+    def set_node(self, G, n):
+        self.graph.add_node(n)
+        attrs = self.graph.nodes[n]
+        attrs.clear()
+        attrs.update(shown(G.nodes[n], hidden_node_attrs))
+
+    def set_edges(self, G, edges):
+        for u, v, key in edges:
+            if G.has_edge(u, v, key):
+                self.graph.add_edge(u, v, key)
+                attrs = self.graph.edges[u, v, key]
+                attrs.clear()
+                attrs.update(shown(G.edges[u, v, key], hidden_edge_attrs))
+            elif self.graph.has_edge(u, v, key):
+                self.graph.remove_edge(u, v, key)
+
+    def apply(self, G, delta:GraphDelta):
+        merged = [ n for _, merged_nodes in delta.merges for n in merged_nodes ]
+        # a node that went and came back is taken out first, so none of its old edges stay
+        self.graph.remove_nodes_from([ n for n in [ *delta.nodes_removed, *merged ] if n in self.graph ])
+        keep_nodes = [ keep_node for keep_node, _ in delta.merges if keep_node in G ]
+        for n in [ *delta.nodes_added, *delta.nodes_updated, *keep_nodes ]:
+            if n in G:
+                self.set_node(G, n)
+        self.set_edges(G, delta.edges_added)
+        for n in keep_nodes:
+            self.set_edges(G, [ *G.in_edges(n, keys=True), *G.out_edges(n, keys=True) ])
@@ -0,0 +1,65 @@
+from fetch import count_requests, run_concurrently
+from util import get_entities
+
+
+class ExpansionEngine:
+    """Finds the entities connected to a set of graph nodes.
+
+    Name ids and address ids pull in every entity that uses them, and every
+    company those entities belong to is then pulled in by file number. Each
+    key is only ever requested once per engine, so the work grows with the
+    number of unseen keys rather than with the size of the graph."""
+
+    def __init__(self, page_size = "max"):
+        self.page_size = page_size
+        self.fetched = {"name_id": set(), "address_id": set(), "file_number": set()}
+        self.rounds = 0
+        self.requests = 0
+
+    def split_keys(self, node_ids:list) -> dict:
+        keys = {"name_id": [], "address_id": [], "file_number": []}
+        for n in node_ids:
+            match n:
+                case str(x) if x[:3] in ['LLC', 'COR']:
+                    keys["file_number"].append(n)
+                case str(x) if x[:1] == "A":
+                    keys["address_id"].append(n[1:])
+                case str(x) if x[:1] == "N":
+                    keys["name_id"].append(n[1:])
+        return keys
+
+    def take_unseen(self, frontier:dict) -> dict:
+        unseen = {}
+        for field, keys in frontier.items():
+            new_keys = [k for k in dict.fromkeys(keys) if k not in self.fetched[field]]
+            self.fetched[field].update(new_keys)
+            if len(new_keys) > 0:
+                unseen[field] = new_keys
+        return unseen
+
+    def expand(self, node_ids:list) -> list:
+        entities = []
+        entity_ids = set()
+        frontier = self.split_keys(node_ids)
+
+        with count_requests() as counter:
+            while True:
+                batch = self.take_unseen(frontier)
+                if len(batch) == 0:
+                    break
+                self.rounds += 1
+                results = run_concurrently([
+                    lambda f=field, k=keys: get_entities(f, k, page_size=self.page_size)
+                    for field, keys in batch.items()
+                ])
+                found = []
+                for result in results:
+                    for e in result:
+                        if e.id not in entity_ids:
+                            entity_ids.add(e.id)
+                            found.append(e)
+                entities += found
+                # only companies are followed; names and addresses they bring in stay leaves
+                frontier = {"file_number": [e.file_number for e in found]}
+        self.requests += counter.count
+        return entities
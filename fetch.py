@@ -0,0 +1,128 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import msgspec
+import requests
+from requests.adapters import HTTPAdapter
+from cache import ResponseCache, normalize_url
+
+# seconds to wait for the server to respond before giving up on a page
+timeout = 30
+
+# upper bound on HTTP requests running at the same time, across all threads
+max_in_flight = 8
+
+# optional ResponseCache; paginated results are stored under their first page's url
+response_cache = None
+
+_session = None
+_session_lock = threading.Lock()
+_in_flight = threading.BoundedSemaphore(max_in_flight)
+_request_counter = contextvars.ContextVar("request_counter", default=None)
+
+
+class RequestCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, n: int = 1):
+        with self._lock:
+            self.count += n
+
+
+@contextmanager
+def count_requests():
+    """Count the HTTP requests made inside the block, including ones made on
+    run_concurrently's worker threads"""
+    counter = RequestCounter()
+    token = _request_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _request_counter.reset(token)
+
+
+def get_session() -> requests.Session:
+    """A process-wide session so every page reuses pooled keep-alive connections"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            adapter = HTTPAdapter(pool_connections=max_in_flight, pool_maxsize=max_in_flight)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def set_max_in_flight(n: int):
+    global max_in_flight, _session, _in_flight
+    with _session_lock:
+        max_in_flight = max(1, int(n))
+        _in_flight = threading.BoundedSemaphore(max_in_flight)
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get(url: str) -> requests.Response:
+    session = get_session()
+    counter = _request_counter.get()
+    if counter is not None:
+        counter.add()
+    with _in_flight:
+        response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response
+
+
+def set_response_cache(cache: ResponseCache | None):
+    global response_cache
+    response_cache = cache
+
+
+_decoders = {}
+
+
+def get_decoder(type = None) -> msgspec.json.Decoder:
+    if type not in _decoders:
+        _decoders[type] = msgspec.json.Decoder(list) if type is None else msgspec.json.Decoder(list[type])
+    return _decoders[type]
+
+
+def paginate(url: str, type = None) -> list:
+    """Fetch every page of a datasette array response. With a msgspec Struct type the
+    rows are decoded straight into instances of it; otherwise they come back as dicts."""
+    decoder = get_decoder(type)
+    cache = response_cache
+    if cache is not None:
+        key = normalize_url(url)
+        cached = cache.get(key)
+        if cached is not None:
+            return decoder.decode(cached)
+
+    items = []
+    while url:
+        response = get(url)
+        try:
+            url = response.links.get("next").get("url")
+        except AttributeError:
+            url = None
+        items.extend(decoder.decode(response.content))
+
+    if cache is not None:
+        cache.set(key, msgspec.json.encode(items))
+    return items
+
+
+def run_concurrently(calls: list) -> list:
+    """Run zero-argument callables side by side and return their results in the same order.
+    The number of HTTP requests actually open is still capped by max_in_flight."""
+    if len(calls) <= 1:
+        return [c() for c in calls]
+    with ThreadPoolExecutor(max_workers=min(len(calls), max_in_flight)) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, c) for c in calls]
+        return [f.result() for f in futures]
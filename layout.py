@@ -0,0 +1,244 @@
+import time
+import numpy as np
+import networkx as nx
+
+# seconds a layout may run before it stops with what it has
+time_budget = 5.0
+
+# iterations for a graph laid out from scratch, and for one that only grew
+full_iterations = 300
+warm_iterations = 40
+
+# up to this many nodes repulsion is worked out exactly; above it, with a Barnes-Hut quadtree
+exact_below = 1500
+
+# bits per axis of the quadtree's Morton codes, which is also its deepest level
+depth = 16
+
+
+def spread_bits(v:np.ndarray) -> np.ndarray:
+    """Put a zero bit between each of the low 16 bits of v"""
+    v = v.astype(np.uint64)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x33333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x55555555)
+    return v
+
+
+class QuadTree:
+    """A Barnes-Hut quadtree over node positions, built level by level from Morton codes.
+
+    Sorting the codes puts every cell's nodes next to each other at every level,
+    so each level is a run-length split of the sorted codes, and its masses and
+    centers of mass are reductions over those runs."""
+
+    def __init__(self, pos:np.ndarray, mass:np.ndarray):
+        low = pos.min(axis=0)
+        self.extent = max(float((pos.max(axis=0) - low).max()), 1e-9)
+        cells = np.minimum(((pos - low) / self.extent * (1 << depth)).astype(np.int64), (1 << depth) - 1)
+        codes = spread_bits(cells[:, 0]) | (spread_bits(cells[:, 1]) << np.uint64(1))
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+        weighted = pos[order] * mass[order, None]
+        # per level: each cell's node count, mass, center, first child and number of children, and each node's cell
+        self.counts, self.mass, self.center, self.first_child, self.children, self.node_cell = [], [], [], [], [], []
+        for level in range(depth + 1):
+            prefix = codes >> np.uint64(2 * (depth - level))
+            starts = np.flatnonzero(np.r_[True, prefix[1:] != prefix[:-1]])
+            counts = np.diff(np.r_[starts, len(codes)])
+            node_cell = np.empty(len(codes), dtype=np.int64)
+            node_cell[order] = np.repeat(np.arange(len(starts)), counts)
+            if level > 0:
+                # a cell's children are the cells of the next level that start inside it
+                first = np.searchsorted(starts, parent_starts)
+                self.first_child.append(first)
+                self.children.append(np.diff(np.r_[first, len(starts)]))
+            cell_mass = np.add.reduceat(mass[order], starts)
+            self.counts.append(counts)
+            self.mass.append(cell_mass)
+            self.center.append(np.add.reduceat(weighted, starts) / cell_mass[:, None])
+            self.node_cell.append(node_cell)
+            parent_starts = starts
+            if counts.max() == 1:
+                break
+
+    def repulsion(self, pos:np.ndarray, mass:np.ndarray, kr:float, theta:float) -> np.ndarray:
+        """FA2 repulsion on every node. Cells far enough away, relative to their size, act
+        as one body at their center of mass; the rest are opened. All nodes walk the tree
+        together, one level at a time, as arrays of (node, cell) pairs."""
+        n = len(pos)
+        force = np.zeros((n, 2))
+        nodes = np.arange(n)
+        cells = np.zeros(n, dtype=np.int64)
+        last = len(self.counts) - 1
+        for level in range(last + 1):
+            size = self.extent / (1 << level)
+            diff = pos[nodes] - self.center[level][cells]
+            d2 = np.maximum(diff[:, 0] ** 2 + diff[:, 1] ** 2, 1e-4)
+            inside = self.node_cell[level][nodes] == cells
+            single = self.counts[level][cells] == 1
+            far = ~inside & (single | (size * size < theta * theta * d2) | (level == last))
+            f = kr * mass[nodes[far]] * self.mass[level][cells[far]] / d2[far]
+            force[:, 0] += np.bincount(nodes[far], weights=f * diff[far, 0], minlength=n)
+            force[:, 1] += np.bincount(nodes[far], weights=f * diff[far, 1], minlength=n)
+            # cells holding the node itself, with others in them, are opened too
+            opened = ~far & ~(inside & single)
+            if level == last or not opened.any():
+                break
+            nodes, cells = nodes[opened], cells[opened]
+            counts = self.children[level][cells]
+            first = self.first_child[level][cells]
+            nodes = np.repeat(nodes, counts)
+            cells = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(len(nodes))
+        return force
+
+
+def exact_repulsion(pos:np.ndarray, mass:np.ndarray, kr:float, block:int = 512) -> np.ndarray:
+    force = np.zeros_like(pos)
+    for start in range(0, len(pos), block):
+        diff = pos[start:start + block, None, :] - pos[None, :, :]
+        d2 = np.maximum((diff ** 2).sum(axis=2), 1e-4)
+        f = kr * mass[start:start + block, None] * mass[None, :] / d2
+        f[np.arange(len(f)), np.arange(start, start + len(f))] = 0
+        force[start:start + block] = (f[:, :, None] * diff).sum(axis=1)
+    return force
+
+
+class ForceAtlas2:
+    """ForceAtlas2 on numpy arrays, with the adaptive speed of the Gephi implementation.
+
+    Nodes repel in proportion to their masses (degree + 1), edges pull their ends
+    together, and gravity keeps components from drifting apart. Each node's step
+    shrinks as it starts to swing back and forth, so a layout that is already
+    close to settled only moves a little."""
+
+    def __init__(self, scaling_ratio:float = 2.0, gravity:float = 1.0, strong_gravity:bool = False, lin_log:bool = False, theta:float = 1.2, jitter_tolerance:float = 1.0):
+        self.scaling_ratio = scaling_ratio
+        self.gravity = gravity
+        self.strong_gravity = strong_gravity
+        self.lin_log = lin_log
+        self.theta = theta
+        self.jitter_tolerance = jitter_tolerance
+
+    def forces(self, pos:np.ndarray, edges:np.ndarray, mass:np.ndarray) -> np.ndarray:
+        n = len(pos)
+        if n > exact_below:
+            force = QuadTree(pos, mass).repulsion(pos, mass, self.scaling_ratio, self.theta)
+        else:
+            force = exact_repulsion(pos, mass, self.scaling_ratio)
+
+        if len(edges) > 0:
+            diff = pos[edges[:, 0]] - pos[edges[:, 1]]
+            if self.lin_log:
+                d = np.maximum(np.sqrt((diff ** 2).sum(axis=1)), 1e-9)
+                diff = diff * (np.log1p(d) / d)[:, None]
+            for axis in (0, 1):
+                force[:, axis] -= np.bincount(edges[:, 0], weights=diff[:, axis], minlength=n)
+                force[:, axis] += np.bincount(edges[:, 1], weights=diff[:, axis], minlength=n)
+
+        d = np.maximum(np.sqrt((pos ** 2).sum(axis=1)), 1e-9)
+        pull = self.gravity * mass * (self.scaling_ratio if self.strong_gravity else 1 / d)
+        force -= pos * pull[:, None]
+        return force
+
+    def run(self, pos:np.ndarray, edges:np.ndarray, iterations:int, budget:float|None = None) -> np.ndarray:
+        """Move pos (n x 2) for up to iterations steps, or until the budget runs out"""
+        n = len(pos)
+        if n < 2:
+            return pos
+        deadline = time.monotonic() + (time_budget if budget is None else budget)
+        mass = 1.0 + np.bincount(edges.ravel(), minlength=n) if len(edges) > 0 else np.ones(n)
+        previous = np.zeros_like(pos)
+        speed, efficiency = 1.0, 1.0
+        estimated = 0.05 * np.sqrt(n)
+        for _ in range(iterations):
+            force = self.forces(pos, edges, mass)
+            swinging = mass * np.sqrt(((force - previous) ** 2).sum(axis=1))
+            traction = mass * np.sqrt(((force + previous) ** 2).sum(axis=1)) / 2
+            total_swinging, total_traction = swinging.sum(), traction.sum()
+
+            jitter = self.jitter_tolerance * max(np.sqrt(estimated), min(10.0, estimated * total_traction / n ** 2))
+            if total_traction > 0 and total_swinging / total_traction > 2.0:
+                if efficiency > 0.05:
+                    efficiency *= 0.5
+                jitter = max(jitter, self.jitter_tolerance)
+            target = jitter * efficiency * total_traction / total_swinging if total_swinging > 0 else speed * 1.5
+            if total_swinging > jitter * total_traction:
+                if efficiency > 0.05:
+                    efficiency *= 0.7
+            elif speed < 1000:
+                efficiency *= 1.3
+            speed += min(target - speed, 0.5 * speed)
+
+            pos = pos + force * (speed / (1 + np.sqrt(speed * swinging)))[:, None]
+            previous = force
+            if time.monotonic() > deadline:
+                break
+        return pos
+
+
+class LayoutJob:
+    """What a layout needs from the graph, copied out of it so it can run on another thread.
+    Nodes in positions keep them as a starting point; the rest start out placed."""
+
+    def __init__(self, G:nx.MultiDiGraph, positions:dict, version:int = 0):
+        self.version = version
+        self.nodes = list(G.nodes())
+        index = { n: i for i, n in enumerate(self.nodes) }
+        self.edges = np.array([ (index[u], index[v]) for u, v in G.edges() if u != v ], dtype=np.int64).reshape(-1, 2)
+        self.pos = np.zeros((len(self.nodes), 2))
+        self.placed = np.zeros(len(self.nodes), dtype=bool)
+        for i, n in enumerate(self.nodes):
+            p = positions.get(n)
+            if p is not None:
+                self.pos[i] = (p["x"], p["y"])
+                self.placed[i] = True
+
+    def place_new_nodes(self, rng:np.random.Generator):
+        """Put each unplaced node at the middle of its placed neighbors, spreading out from
+        the placed part of the graph. A group with no placed neighbor at all starts from
+        one node put just outside what is already there."""
+        pos, placed, edges = self.pos, self.placed, self.edges
+        n = len(pos)
+        if placed.all():
+            return
+        if placed.any():
+            spacing = np.median(np.sqrt(((pos[edges[:, 0]] - pos[edges[:, 1]]) ** 2).sum(axis=1))[placed[edges].all(axis=1)]) if placed[edges].all(axis=1).any() else 1.0
+            radius = float(np.sqrt((pos[placed] ** 2).sum(axis=1)).max())
+        else:
+            spacing, radius = 1.0, 0.0
+        spacing = max(float(spacing), 1e-3)
+        both = np.r_[edges, edges[:, ::-1]]
+        while not placed.all():
+            reach = both[placed[both[:, 1]] & ~placed[both[:, 0]]]
+            if len(reach) > 0:
+                counts = np.bincount(reach[:, 0], minlength=n)
+                fresh = counts > 0
+                for axis in (0, 1):
+                    pos[fresh, axis] = np.bincount(reach[:, 0], weights=pos[reach[:, 1], axis], minlength=n)[fresh] / counts[fresh]
+                pos[fresh] += rng.normal(scale=spacing, size=(fresh.sum(), 2))
+                placed |= fresh
+                continue
+            # nothing left touches a placed node; seed every remaining group at once
+            unplaced = np.flatnonzero(~placed)
+            groups = nx.Graph()
+            groups.add_nodes_from(unplaced)
+            groups.add_edges_from(map(tuple, both[~placed[both[:, 0]] & ~placed[both[:, 1]]]))
+            seeds = [ max(c, key=groups.degree) for c in nx.connected_components(groups) ]
+            angle = rng.uniform(0, 2 * np.pi, len(seeds))
+            distance = radius + spacing * (1 + np.sqrt(len(unplaced))) * rng.uniform(0.5, 1.5, len(seeds))
+            pos[seeds] = np.c_[np.cos(angle), np.sin(angle)] * distance[:, None]
+            placed[seeds] = True
+
+    def run(self, fa2:ForceAtlas2|None = None, budget:float|None = None, iterations:int|None = None, seed:int = 0) -> dict:
+        """Positions for every node, as ipysigma's layout takes them. With iterations=0
+        the new nodes are only placed, and nothing that was already placed moves."""
+        if len(self.nodes) == 0:
+            return {}
+        if iterations is None:
+            iterations = warm_iterations if self.placed.any() else full_iterations
+        self.place_new_nodes(np.random.default_rng(seed))
+        fa2 = ForceAtlas2() if fa2 is None else fa2
+        pos = fa2.run(self.pos, self.edges, iterations, budget)
+        return { n: {"x": float(x), "y": float(y)} for n, (x, y) in zip(self.nodes, pos) }
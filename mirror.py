@@ -0,0 +1,126 @@
+import csv
+import os
+import sqlite3
+import threading
+from business_class import Entity, ForeignKey
+
+# SQLite caps the number of bound parameters per statement
+max_params = 900
+
+schema = """
+CREATE TABLE IF NOT EXISTS names (
+    id INTEGER PRIMARY KEY,
+    name TEXT COLLATE NOCASE
+);
+CREATE TABLE IF NOT EXISTS addresses (
+    id INTEGER PRIMARY KEY,
+    street TEXT COLLATE NOCASE
+);
+CREATE TABLE IF NOT EXISTS entities (
+    id INTEGER PRIMARY KEY,
+    file_number TEXT COLLATE NOCASE,
+    type TEXT,
+    name_id INTEGER,
+    address_id INTEGER
+);
+"""
+
+indexes = """
+CREATE INDEX IF NOT EXISTS names_name ON names (name);
+CREATE INDEX IF NOT EXISTS addresses_street ON addresses (street);
+CREATE INDEX IF NOT EXISTS entities_name_id ON entities (name_id);
+CREATE INDEX IF NOT EXISTS entities_address_id ON entities (address_id);
+CREATE INDEX IF NOT EXISTS entities_file_number ON entities (file_number);
+"""
+
+entity_select = """
+SELECT e.id, e.file_number, e.type, e.name_id, n.name, e.address_id, a.street
+FROM entities e
+LEFT JOIN names n ON n.id = e.name_id
+LEFT JOIN addresses a ON a.id = e.address_id
+"""
+
+
+def read_rows(filename:str, columns:list):
+    with open(filename, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            yield tuple(row[c] if row[c] != "" else None for c in columns)
+
+
+def build_mirror(path:str, entities_file:str, names_file:str, addresses_file:str):
+    """Load delimited exports of the companies tables into a local SQLite mirror.
+
+    The files need the same columns as the datasette tables:
+    entities (id, file_number, type, name_id, address_id), names (id, name)
+    and addresses (id, street). Indexes are created after the load."""
+    if os.path.dirname(path) != "":
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + schema)
+    with db:
+        db.executemany("INSERT OR REPLACE INTO names VALUES (?, ?)", read_rows(names_file, ["id", "name"]))
+        db.executemany("INSERT OR REPLACE INTO addresses VALUES (?, ?)", read_rows(addresses_file, ["id", "street"]))
+        db.executemany(
+            "INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?)",
+            read_rows(entities_file, ["id", "file_number", "type", "name_id", "address_id"])
+        )
+    db.executescript(indexes + "ANALYZE;")
+    db.close()
+
+
+class LocalMirror:
+    """Answers the same queries as DatasetteBackend from a SQLite mirror built with build_mirror"""
+
+    def __init__(self, path:str):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"no companies mirror at {path}")
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        # sqlite connections stay on the thread that opened them
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.db = db
+        return db
+
+    def entity_rows(self, sql:str, params) -> list:
+        return [
+            Entity(
+                id,
+                file_number,
+                type,
+                ForeignKey(name_id, name) if name_id is not None else None,
+                ForeignKey(address_id, street) if address_id is not None else None,
+            )
+            for (id, file_number, type, name_id, name, address_id, street) in self.db.execute(sql, params)
+        ]
+
+    def entities_in(self, field:str, values:list, company_only:bool = False, page_size = None) -> list:
+        if field not in ("name_id", "address_id", "file_number"):
+            raise ValueError(f"can't look up entities by {field}")
+        rows = []
+        seen = set()
+        for i in range(0, len(values), max_params):
+            chunk = values[i:i + max_params]
+            sql = f"{entity_select} WHERE e.{field} IN ({', '.join('?' * len(chunk))})"
+            if company_only:
+                sql += " AND e.type = 'company'"
+            for row in self.entity_rows(sql + " ORDER BY e.id", chunk):
+                if row.id not in seen:
+                    seen.add(row.id)
+                    rows.append(row)
+        return rows
+
+    def entities_like(self, field:str, pattern:str) -> list:
+        if field != "file_number":
+            raise ValueError(f"can't search entities by {field}")
+        return self.entity_rows(f"{entity_select} WHERE e.file_number LIKE ? ORDER BY e.id", (pattern,))
+
+    def name_ids(self, pattern:str) -> list:
+        return [r[0] for r in self.db.execute("SELECT id FROM names WHERE name LIKE ? ORDER BY id", (pattern,))]
+
+    def address_ids(self, pattern:str) -> list:
+        return [r[0] for r in self.db.execute("SELECT id FROM addresses WHERE street LIKE ? ORDER BY id", (pattern,))]
@@ -0,0 +1,136 @@
+import os
+import msgspec
+import probablepeople as pp
+import usaddress
+from address_util import get_label
+from cache import LRUCache, ResponseCache
+
+
+class ParseCache:
+    """Memoizes an expensive parser by its input string.
+
+    Results live in a bounded LRU in memory and, when a store is given, in a
+    ResponseCache on disk so they survive restarts."""
+
+    def __init__(self, parse, maxsize: int = 50_000, store: ResponseCache | None = None, namespace: str = ""):
+        self.parse = parse
+        self.memory = LRUCache(maxsize)
+        self.store = store
+        self.namespace = namespace
+        self.disk_hits = 0
+        self.parsed = 0
+
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if self.store is not None:
+            stored = self.store.get(self.namespace + key)
+            if stored is not None:
+                value = msgspec.json.decode(stored)
+                self.disk_hits += 1
+                self.memory.set(key, value)
+                return value
+
+        value = self.parse(key)
+        self.parsed += 1
+        self.memory.set(key, value)
+        if self.store is not None:
+            self.store.set(self.namespace + key, msgspec.json.encode(value), ttl=None)
+        return value
+
+    def stats(self) -> dict:
+        return {**self.memory.stats(), "disk_hits": self.disk_hits, "parsed": self.parsed}
+
+
+# parses are deterministic, so they are kept on disk without expiry; set PARSE_CACHE="" to keep them in memory only
+parse_cache_path = os.environ.get("PARSE_CACHE", ".cache/parses.sqlite")
+parse_store = ResponseCache(parse_cache_path, ttl=None, max_bytes=64 * 1024 * 1024) if parse_cache_path else None
+
+name_parses = ParseCache(pp.parse, store=parse_store, namespace="name:")
+
+
+def parse_name(name: str) -> list:
+    """probablepeople's (token, label) pairs for a cleaned-up name"""
+    return name_parses.get(name)
+
+
+class AddressParse:
+    """Everything derived from one raw address label, each part computed the first time it's asked for"""
+    __slots__ = ("raw", "label", "components")
+
+    def __init__(self, raw: str):
+        self.raw = raw
+        self.label = None
+        self.components = None
+
+
+class AddressCache:
+    """One entry per raw address label, shared by street cleaning, duplicate
+    detection and the contract search"""
+
+    # usaddress refuses some labels; remember that instead of retrying every time
+    unparseable = {}
+
+    def __init__(self, maxsize: int = 50_000):
+        self.entries = LRUCache(maxsize)
+        self.label_hits = 0
+        self.label_misses = 0
+        self.tag_hits = 0
+        self.tag_misses = 0
+
+    def entry(self, raw: str) -> AddressParse:
+        entry = self.entries.get(raw)
+        if entry is None:
+            entry = AddressParse(raw)
+            self.entries.set(raw, entry)
+        return entry
+
+    def label(self, raw: str) -> str:
+        entry = self.entry(raw)
+        if entry.label is None:
+            self.label_misses += 1
+            entry.label = get_label(raw)
+        else:
+            self.label_hits += 1
+        return entry.label
+
+    def components(self, raw: str) -> dict | None:
+        entry = self.entry(raw)
+        if entry.components is None:
+            self.tag_misses += 1
+            try:
+                entry.components = dict(usaddress.tag(raw.upper())[0])
+            except Exception as e:
+                print(e, raw)
+                entry.components = self.unparseable
+        else:
+            self.tag_hits += 1
+        return None if entry.components is self.unparseable else entry.components
+
+    def stats(self) -> dict:
+        labels = self.label_hits + self.label_misses
+        tags = self.tag_hits + self.tag_misses
+        return {
+            "label_hits": self.label_hits,
+            "label_misses": self.label_misses,
+            "label_hit_rate": self.label_hits / labels if labels > 0 else 0.0,
+            "tag_hits": self.tag_hits,
+            "tag_misses": self.tag_misses,
+            "tag_hit_rate": self.tag_hits / tags if tags > 0 else 0.0,
+            "size": len(self.entries),
+        }
+
+
+address_parses = AddressCache()
+
+
+def address_label(raw: str) -> str:
+    """The canonical form of an address label"""
+    return address_parses.label(raw)
+
+
+def address_components(label: str) -> dict | None:
+    """usaddress's tagged parts of an address label, or None if it can't be tagged"""
+    return address_parses.components(label)
@@ -0,0 +1,196 @@
+import time
+import msgspec
+import numpy as np
+from adjacency import Adjacency, gather
+
+# seconds a path search may run before it stops and reports what it has
+time_budget = 5.0
+
+
+class PathResult(msgspec.Struct):
+    nodes : set = set()
+    distance : int | None = None
+    paths : int | None = None
+    truncated : bool = False
+    reason : str = ""
+
+
+class PathEngine:
+    """Paths between two nodes of an Adjacency snapshot, ignoring edge direction.
+
+    The shortest distance comes from a bidirectional BFS that always grows the
+    smaller frontier, and the nodes on every shortest path are read off the BFS
+    layers by walking back from where the two searches met, so the paths are
+    never listed one by one. k_shortest instead lists up to k simple paths,
+    shortest first, which can include longer detours: a depth-first search for
+    paths of each length in turn, pruned by the BFS distances to the target."""
+
+    def __init__(self, adjacency:Adjacency, max_length:int|None = None, budget:float|None = None):
+        self.adjacency = adjacency
+        self.max_length = max_length
+        self.budget = time_budget if budget is None else budget
+        self.deadline = None
+
+    def out_of_time(self) -> bool:
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def meet(self, s:int, t:int):
+        """BFS from both ends until they meet. Returns (distance, dist_s, dist_t),
+        with distance None if there is no path or the search was cut short."""
+        indptr, cols = self.adjacency.csr()
+        n = len(self.adjacency.ids)
+        dist = { s: np.full(n, -1, dtype=np.int32), t: np.full(n, -1, dtype=np.int32) }
+        dist[s][s] = 0
+        dist[t][t] = 0
+        frontier = { s: np.array([s]), t: np.array([t]) }
+        depth = { s: 0, t: 0 }
+        while len(frontier[s]) > 0 and len(frontier[t]) > 0:
+            if self.max_length is not None and depth[s] + depth[t] >= self.max_length:
+                return None, dist[s], dist[t]
+            if self.out_of_time():
+                return None, dist[s], dist[t]
+            # grow whichever side has fewer edges to follow
+            work = { end: int((indptr[frontier[end] + 1] - indptr[frontier[end]]).sum()) for end in (s, t) }
+            side, other = (s, t) if work[s] <= work[t] else (t, s)
+            reached = gather(indptr, cols, frontier[side])
+            reached = np.unique(reached[dist[side][reached] < 0])
+            depth[side] += 1
+            dist[side][reached] = depth[side]
+            frontier[side] = reached
+            met = reached[dist[other][reached] >= 0]
+            if len(met) > 0:
+                return int((dist[side][met] + dist[other][met]).min()), dist[s], dist[t]
+        return None, dist[s], dist[t]
+
+    def walk_back(self, start:np.ndarray, dist:np.ndarray) -> np.ndarray:
+        """Every node on a shortest route from the BFS root to any of start"""
+        indptr, cols = self.adjacency.csr()
+        found = [start]
+        level = start
+        depth = int(dist[start].max())
+        while depth > 0:
+            at_depth = start[dist[start] == depth]
+            level = np.union1d(level[dist[level] == depth], at_depth)
+            previous = gather(indptr, cols, level)
+            level = np.unique(previous[dist[previous] == depth - 1])
+            found.append(level)
+            depth -= 1
+        return np.unique(np.concatenate(found))
+
+    def distances(self, root:int, limit:int) -> np.ndarray:
+        """Hop counts from root, up to limit; -1 beyond it or where unreachable"""
+        indptr, cols = self.adjacency.csr()
+        dist = np.full(len(self.adjacency.ids), -1, dtype=np.int32)
+        dist[root] = 0
+        frontier = np.array([root])
+        depth = 0
+        while len(frontier) > 0 and depth < limit:
+            depth += 1
+            reached = gather(indptr, cols, frontier)
+            frontier = np.unique(reached[dist[reached] < 0])
+            dist[frontier] = depth
+        return dist
+
+    def count_shortest(self, s:int, dist_t:np.ndarray) -> float:
+        """How many shortest paths run from s to the BFS root of dist_t, counted layer by layer"""
+        indptr, cols = self.adjacency.csr()
+        count = np.zeros(len(dist_t))
+        count[dist_t == 0] = 1
+        for depth in range(1, int(dist_t[s]) + 1):
+            level = np.flatnonzero(dist_t == depth)
+            rows = np.repeat(level, indptr[level + 1] - indptr[level])
+            previous = gather(indptr, cols, level)
+            down = dist_t[previous] == depth - 1
+            np.add.at(count, rows[down], count[previous[down]])
+        return float(count[s])
+
+    def paths_of_length(self, s:int, t:int, length:int, dist_t:np.ndarray):
+        """Simple paths of exactly length steps from s to t, depth first. A node is only
+        stepped onto if t is still within reach of it in the steps that are left."""
+        on_path = np.zeros(len(dist_t), dtype=bool)
+        on_path[s] = True
+        path = [s]
+        stack = [self.steps(s, length, dist_t, on_path)]
+        while len(stack) > 0:
+            if self.out_of_time():
+                return
+            if len(stack[-1]) == 0:
+                stack.pop()
+                on_path[path.pop()] = False
+                continue
+            v = stack[-1].pop()
+            if v == t:
+                if len(path) == length:
+                    yield path + [t]
+                continue
+            path.append(v)
+            on_path[v] = True
+            stack.append(self.steps(v, length - len(path) + 1, dist_t, on_path))
+
+    def steps(self, u:int, left:int, dist_t:np.ndarray, on_path:np.ndarray) -> list:
+        indptr, cols = self.adjacency.csr()
+        neighbors = cols[indptr[u]:indptr[u + 1]]
+        reach = dist_t[neighbors]
+        return neighbors[(reach >= 0) & (reach < left) & ~on_path[neighbors]][::-1].tolist()
+
+    def no_path(self) -> PathResult:
+        if self.out_of_time():
+            return PathResult(truncated=True, reason=f"stopped after {self.budget:g} seconds")
+        if self.max_length is not None:
+            return PathResult(reason=f"no path of {self.max_length} steps or fewer")
+        return PathResult(reason="not connected")
+
+    def shortest(self, source, target) -> PathResult:
+        adjacency = self.adjacency
+        if source not in adjacency or target not in adjacency:
+            return PathResult(reason="not in the graph")
+        s, t = adjacency.index[source], adjacency.index[target]
+        if s == t:
+            return PathResult(nodes={source}, distance=0)
+        self.deadline = time.monotonic() + self.budget
+        distance, dist_s, dist_t = self.meet(s, t)
+        if distance is None:
+            return self.no_path()
+        known = (dist_s >= 0) & (dist_t >= 0)
+        met = np.flatnonzero(known & (dist_s + dist_t == distance))
+        rows = np.union1d(self.walk_back(met, dist_s), self.walk_back(met, dist_t))
+        return PathResult(nodes={ adjacency.ids[i] for i in rows }, distance=distance)
+
+    def k_shortest(self, source, target, k:int) -> PathResult:
+        adjacency = self.adjacency
+        if source not in adjacency or target not in adjacency:
+            return PathResult(reason="not in the graph")
+        s, t = adjacency.index[source], adjacency.index[target]
+        if s == t:
+            return PathResult(nodes={source}, distance=0, paths=1)
+        self.deadline = time.monotonic() + self.budget
+        distance, _, _ = self.meet(s, t)
+        if distance is None:
+            return self.no_path()
+        limit = len(adjacency) - 1 if self.max_length is None else self.max_length
+        dist_t = self.distances(t, limit)
+        # no simple path is longer than the part of the graph t can reach
+        limit = min(limit, int((dist_t >= 0).sum()) - 1)
+        rows = set()
+        count = 0
+        for length in range(distance, limit + 1):
+            for path in self.paths_of_length(s, t, length, dist_t):
+                rows.update(path)
+                count += 1
+                if count == k:
+                    break
+            if count == k or self.out_of_time():
+                break
+        nodes = { adjacency.ids[i] for i in rows }
+        if count < k and self.out_of_time():
+            return PathResult(nodes=nodes, distance=distance, paths=count, truncated=True, reason=f"stopped after {self.budget:g} seconds")
+        if count == k and length == distance:
+            total = self.count_shortest(s, dist_t)
+            if total > k:
+                return PathResult(nodes=nodes, distance=distance, paths=count, truncated=True, reason=f"showing {k} of {total:.0f} shortest paths")
+        return PathResult(nodes=nodes, distance=distance, paths=count)
+
+
+def find_paths(adjacency:Adjacency, source, target, k:int|None = None, max_length:int|None = None, budget:float|None = None) -> PathResult:
+    engine = PathEngine(adjacency, max_length, budget)
+    return engine.k_shortest(source, target, k) if k else engine.shortest(source, target)
@@ -1,8 +1,13 @@
 import io 
+import re
+import hashlib
+from itertools import repeat
 import msgspec
+import pandas as pd
 from ipysigma import Sigma
 import networkx as nx 
 from typing import Optional
+from delta import GraphDelta
     
 class Element(msgspec.Struct):
     type : str 
@@ -35,6 +40,41 @@ class NodeFactory(msgspec.Struct, kw_only=True):
             "attr": {**{a: data.get(a, None) for a in self.attr}, "tidy": self.tidy, "data_source": data_source}
         })
         
+    def compile(self):
+        """make_node(...).nx_format() as one generated function with the schema's choices made up front"""
+        label = f"str(get({self.label_field!r}))" if self.label_field else "node_id"
+        node_type = f"get({self.type.value!r})" if self.type.type == "field" else repr(self.type.value)
+        attrs = "".join(f"{a!r}: get({a!r}), " for a in self.attr)
+        # repeated keys keep the first one's position and the last one's value, like the ** merges in make_node
+        return generate("make_node", ["data", "data_source"], [
+            "get = data.get",
+            f"node_id = str(get({self.id_field!r}))",
+            f"return (node_id, {{'label': {label}, 'type': {node_type}, 'data_source': '', {attrs}'tidy': {self.tidy!r}, 'data_source': data_source}})",
+        ])
+
+    def frame_nodes(self, df:pd.DataFrame, data_source:str = "", exclude:re.Pattern|None = None, excluded:set|None = None) -> list:
+        """make_node over every row of df at once, skipping rows without an id"""
+        df = df[df[self.id_field].notna()] if self.id_field in df.columns else df.iloc[0:0]
+        ids = column(df, self.id_field).map(str)
+        labels = column(df, self.label_field).map(str) if self.label_field else ids
+        if exclude is not None:
+            dropped = labels.str.contains(exclude).fillna(False).astype(bool)
+            if excluded is not None:
+                excluded.update(ids[dropped])
+            df, ids, labels = df[~dropped], ids[~dropped], labels[~dropped]
+
+        # every row yields the same keys, so the last row for an id is what the merge would leave
+        last = ~ids.duplicated(keep='last')
+        df, ids, labels = df[last], ids[last], labels[last]
+        attrs = {
+            "label": labels,
+            "type": column(df, self.type.value) if self.type.type == "field" else self.type.value,
+            "data_source": data_source,
+            **{a: column(df, a) for a in self.attr},
+            "tidy": self.tidy,
+        }
+        return list(zip(ids.tolist(), records(attrs, len(df))))
+
     def to_dict(self):
         return {
             "id": self.id_field, 
@@ -44,6 +84,39 @@ class NodeFactory(msgspec.Struct, kw_only=True):
         }
 
 
+def column(df:pd.DataFrame, field:str|None) -> pd.Series:
+    # a field the data doesn't have reads as missing, like data.get(field) does
+    if field in df.columns:
+        return df[field]
+    return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+
+def generate(name:str, args:list, body:list, namespace:dict|None = None):
+    source = f"def {name}({', '.join(args)}):\n" + "".join(f"    {line}\n" for line in body)
+    namespace = dict(namespace or {})
+    exec(compile(source, f"<{name}>", "exec"), namespace)
+    return namespace[name]
+
+
+def to_number(value):
+    """LinkFactory.type_check, skipping the exception for missing values and floats"""
+    if value is None:
+        return None
+    if value.__class__ is float:
+        return value
+    try:
+        return float(value)
+    except Exception:
+        return value
+
+
+def records(columns:dict, length:int) -> list:
+    """Row dicts from a dict of Series and constants, without going through DataFrame.to_dict"""
+    keys = list(columns)
+    values = [ c.tolist() if isinstance(c, pd.Series) else repeat(c, length) for c in columns.values() ]
+    return [ dict(zip(keys, row)) for row in zip(*values) ] if len(keys) > 0 else [ {} for _ in range(length) ]
+
+
 class Link(msgspec.Struct):
     source : str 
     target : str 
@@ -76,6 +149,37 @@ class LinkFactory(msgspec.Struct):
             return detail
         
         
+    def compile(self):
+        """make_link(...).nx_format() as one generated function; only the declared attrs are coerced"""
+        link_type = f"get({self.type.value!r})" if self.type.type == "field" else repr(self.type.value)
+        attrs = "".join(f"{a!r}: to_number(get({a!r})), " for a in self.attr)
+        return generate("make_link", ["data"], [
+            "get = data.get",
+            f"source = get({self.source_field!r})",
+            "if source is None: return None",
+            f"target = get({self.target_field!r})",
+            "if target is None: return None",
+            f"return (str(source), str(target), {{'type': {link_type}, {attrs}}})",
+        ], {"to_number": to_number})
+
+    def frame_links(self, df:pd.DataFrame) -> list:
+        """make_link over every row of df at once, skipping rows missing either end"""
+        keep = column(df, self.source_field).notna() & column(df, self.target_field).notna()
+        df = df[keep]
+        attrs = {}
+        for a in self.attr:
+            # value by value, as make_link does, so "1000" is 1000.0 whatever else is in the frame;
+            # a frame's missing values read as None, as they do in a row
+            values = column(df, a)
+            attrs[a] = pd.Series([ None if pd.isna(v) else to_number(v) for v in values.tolist() ], index=values.index, dtype=object)
+        attrs = {
+            "type": column(df, self.type.value) if self.type.type == "field" else self.type.value,
+            **attrs
+        }
+        sources = column(df, self.source_field).map(str).tolist()
+        targets = column(df, self.target_field).map(str).tolist()
+        return list(zip(sources, targets, records(attrs, len(df))))
+
     def make_link(self, data:dict):
         if data.get(self.source_field) is not None and data.get(self.target_field) is not None:
             return(Link(**{
@@ -91,6 +195,9 @@ class GraphSchema(msgspec.Struct):
     node_factories: dict[str, NodeFactory]
     link_factories: list[LinkFactory]
 
+    def compile(self):
+        return CompiledGraphFactory(node_factories=list(self.node_factories.values()), link_factories=self.link_factories)
+
     
 class GraphFactory(msgspec.Struct):
     node_factories : list[NodeFactory]
@@ -110,25 +217,157 @@ class GraphFactory(msgspec.Struct):
         links = self.make_links(data)
         return [ link.nx_format() for link in links if link is not None]
     
-    def make_graphs(self, data:list, data_source:str):
+    def collect(self, data:list, data_source:str, exclude:re.Pattern|None = None, excluded:set|None = None):
+        """nx-format nodes and edges for every row. Nodes whose label matches exclude are
+        dropped and their ids added to excluded; edges touching an excluded id are dropped too.
+        data can be a list of row dicts, or a DataFrame / dict of columns for the columnar path."""
+        excluded = set() if excluded is None else excluded
         nodes = []
         edges = []
+        if isinstance(data, (pd.DataFrame, dict)):
+            df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+            for nf in self.node_factories:
+                nodes += nf.frame_nodes(df, data_source, exclude, excluded)
+            for lf in self.link_factories:
+                edges += lf.frame_links(df)
+        else:
+            self.collect_rows(data, data_source, exclude, excluded, nodes, edges)
+        if len(excluded) > 0:
+            edges = [ e for e in edges if e[0] not in excluded and e[1] not in excluded ]
+        return nodes, edges
+    
+    def collect_rows(self, data:list, data_source:str, exclude:re.Pattern|None, excluded:set, nodes:list, edges:list):
         for d in data:
-            nodes += self.nx_nodes(d, data_source)
+            for node in self.nx_nodes(d, data_source):
+                if exclude is not None and exclude.search(node[1]['label']):
+                    excluded.add(node[0])
+                else:
+                    nodes.append(node)
             edges += self.nx_edges(d)
-                    
+
+    def make_graphs(self, data:list, data_source:str, exclude:re.Pattern|None = None, excluded:set|None = None):
+        nodes, edges = self.collect(data, data_source, exclude, excluded)
         G = nx.MultiDiGraph()
         G.add_nodes_from(nodes)
-        G.add_edges_from(edges)
+        G.add_edges_from(keyed_edges(edges))
         return G 
     
+    def add_to_graph(self, G:nx.MultiDiGraph, data:list, data_source:str, exclude:re.Pattern|None = None, excluded:set|None = None) -> GraphDelta:
+        """Add the nodes and edges make_graphs would produce straight into G.
+        Attributes merge the way nx.compose(G, self.make_graphs(...)) would merge them."""
+        nodes, edges = self.collect(data, data_source, exclude, excluded)
+        return add_nx_elements(G, nodes, edges)
+
     def make_graph(self, data:dict, data_source:str):
         G = nx.MultiDiGraph()
         G.add_nodes_from(self.nx_nodes(data, data_source))
-        G.add_edges_from(self.nx_edges(data))
+        G.add_edges_from(keyed_edges(self.nx_edges(data)))
         return G 
 
 
+class CompiledGraphFactory(GraphFactory):
+    """A GraphFactory whose row path runs through functions generated once from its factories"""
+    node_makers : list = []
+    link_makers : list = []
+    row_collector : object = None
+
+    def __post_init__(self):
+        self.node_makers = [ nf.compile() for nf in self.node_factories ]
+        self.link_makers = [ lf.compile() for lf in self.link_factories ]
+        # collect_rows with the factory loop unrolled, so each row costs one call per factory
+        body = [
+            "add_node = nodes.append",
+            "add_edge = edges.append",
+            "search = exclude.search if exclude is not None else None",
+            "for data in rows:",
+        ]
+        for i in range(len(self.node_makers)):
+            body += [
+                f"    node = make_node_{i}(data, data_source)",
+                "    if search is not None and search(node[1]['label']):",
+                "        excluded.add(node[0])",
+                "    else:",
+                "        add_node(node)",
+            ]
+        for i in range(len(self.link_makers)):
+            body += [
+                f"    edge = make_link_{i}(data)",
+                "    if edge is not None:",
+                "        add_edge(edge)",
+            ]
+        if len(body) == 4:
+            body.append("    pass")
+        self.row_collector = generate("collect_rows", ["rows", "data_source", "exclude", "excluded", "nodes", "edges"], body, {
+            **{ f"make_node_{i}": make for i, make in enumerate(self.node_makers) },
+            **{ f"make_link_{i}": make for i, make in enumerate(self.link_makers) },
+        })
+
+    def collect_rows(self, data:list, data_source:str, exclude:re.Pattern|None, excluded:set, nodes:list, edges:list):
+        self.row_collector(data, data_source, exclude, excluded, nodes, edges)
+
+    def nx_nodes(self, data:dict, data_source:str):
+        return [ make(data, data_source) for make in self.node_makers ]
+
+    def nx_edges(self, data:dict):
+        return [ edge for edge in (make(data) for make in self.link_makers) if edge is not None ]
+
+
+def edge_key(attrs:dict) -> str:
+    """Edges between the same two nodes with equal attributes get the same key,
+    so adding one that is already there changes nothing"""
+    return hashlib.blake2b(msgspec.json.encode(attrs, enc_hook=str, order="sorted"), digest_size=8).hexdigest()
+
+
+def keyed_edges(edges:list) -> list:
+    return [ (u, v, edge_key(attrs), attrs) for u, v, attrs in edges ]
+
+
+def add_nx_elements(G:nx.MultiDiGraph, nodes:list, edges:list) -> GraphDelta:
+    delta = GraphDelta()
+    seen = set()
+    for n, attrs in nodes:
+        if n in seen:
+            G.nodes[n].update(attrs)
+            continue
+        seen.add(n)
+        if n in G:
+            delta.nodes_updated.append(n)
+            G.nodes[n].update(attrs)
+        else:
+            delta.nodes_added.append(n)
+            G.add_node(n, **attrs)
+
+    for u, v, key, attrs in keyed_edges(edges):
+        if G.has_edge(u, v, key):
+            continue
+        for n in (u, v):
+            if n not in G:
+                delta.nodes_added.append(n)
+                G.add_node(n)
+        delta.edges_added.append((u, v, key))
+        G.add_edge(u, v, key, **attrs)
+    return delta
+
+
+def add_graph(G:nx.MultiDiGraph, H:nx.MultiDiGraph) -> GraphDelta:
+    """nx.compose(G, H), but written into G so the cost is the size of H.
+    H's edges are re-keyed with edge_key, so ones G already has are not doubled."""
+    delta = GraphDelta()
+    for n, attrs in H.nodes(data=True):
+        if n in G:
+            delta.nodes_updated.append(n)
+            G.nodes[n].update(attrs)
+        else:
+            delta.nodes_added.append(n)
+            G.add_node(n, **attrs)
+    for u, v, attrs in H.edges(data=True):
+        key = edge_key(attrs)
+        if not G.has_edge(u, v, key):
+            delta.edges_added.append((u, v, key))
+            G.add_edge(u, v, key, **attrs)
+    return delta
+
+
 class SigmaFactory(msgspec.Struct):
     height : int = 1000
     layout_settings : dict | None = None
@@ -146,7 +385,7 @@ class SigmaFactory(msgspec.Struct):
     layout : dict|None = None
     camera_state : dict = {}
         
-    def make_sigma(self, G:nx.MultiGraph, node_colors:dict|None = None, edge_colors:dict|None = None, layout = None, camera_state = {}):
+    def make_sigma(self, G:nx.MultiGraph, node_colors:dict|None = None, edge_colors:dict|None = None, layout = None, camera_state = {}, start_layout = None):
         
         if node_colors is None or len(node_colors) == 0:
             node_colors = self.node_color_palette
@@ -171,7 +410,7 @@ class SigmaFactory(msgspec.Struct):
             node_color_palette=     node_colors,
             selected_node=          self.selected_node,
             layout =                self.layout if layout is None else layout,
-            start_layout =          (len(G) / 10 ) if layout is None else len(G) / 20
+            start_layout =          start_layout if start_layout is not None else (len(G) / 10 ) if layout is None else len(G) / 20
         )
     
     def export_graph(self, G:nx.MultiGraph, layout = None, camera_state = {}):
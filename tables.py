@@ -0,0 +1,236 @@
+from collections import Counter
+import msgspec
+import pandas as pd
+from delta import GraphDelta
+
+node_drop_cols = ['contraction', 'dg_type', 'tidy']
+node_main_cols = ['label', 'type', 'data_source', 'merged_with', 'node_id', 'alias_id']
+edge_drop_cols = ['node1_id', 'node2_id', 'contraction', 'file_number']
+edge_main_cols = ['node1', 'type', 'relationship', 'node2', 'for_company']
+
+
+def node_label(G, n):
+    return G.nodes[n].get('label', n)
+
+
+def node_record(G, n) -> dict:
+    record = { "node_id": n, **G.nodes[n] }
+    for c in node_drop_cols:
+        record.pop(c, None)
+    return record
+
+
+def edge_records(G, u, v, attrs:dict) -> list:
+    """The inbound and outbound rows the edges table shows for one edge"""
+    if attrs.get('type') == "company":
+        return []
+    # companies read as their label; one with no label yet reads as "" and one not in the graph as its id
+    file_number = attrs.get('file_number')
+    for_company = None if file_number is None else G.nodes[file_number].get('label', "") if file_number in G else file_number
+    details = { k: x for k, x in attrs.items() if k not in edge_drop_cols }
+    address = attrs.get('type') == "address"
+    return [
+        { "node1": node_label(G, v), "relationship": "of" if address else "is", "node2": node_label(G, u), "for_company": for_company, **details },
+        { "node1": node_label(G, u), "relationship": "is" if address else "of", "node2": node_label(G, v), "for_company": for_company, **details },
+    ]
+
+
+def fingerprint(record:dict) -> bytes:
+    return msgspec.json.encode(record, enc_hook=str, order="sorted")
+
+
+def ordered(df:pd.DataFrame, main_cols:list) -> pd.DataFrame:
+    main = [ c for c in main_cols if c in df.columns ]
+    return df[[ *main, *[ c for c in df.columns if c not in main ] ]]
+
+
+class TableModel:
+    """The node, edge and overview tables of the Table view, kept in step with graph deltas.
+
+    Each edge contributes an inbound and an outbound row; identical rows are stored
+    once with a count. The overview is a count of (node1, relationship, node2)
+    over the distinct edge rows, so it changes with them rather than being
+    regrouped from the whole edge table. Frames are only built when asked for,
+    and reused until the next change."""
+
+    def __init__(self):
+        self.graph = None
+        self.nodes = {}
+        self.edges = {}
+        self.node_edges = {}
+        self.company_edges = {}
+        self.rows = {}
+        self.overview = {}
+        self.version = 0
+        self.frames = {}
+
+    def in_sync(self, G) -> bool:
+        return self.graph is G
+
+    def sync(self, G):
+        if not self.in_sync(G):
+            self.rebuild(G)
+
+    def rebuild(self, G):
+        version = self.version
+        self.__init__()
+        self.version = version + 1
+        for n in G.nodes():
+            self.nodes[n] = node_record(G, n)
+        for u, v, key, attrs in G.edges(keys=True, data=True):
+            self.add_edge(G, u, v, key, attrs)
+        self.graph = G
+
+    ### Rows
+
+    def add_row(self, record:dict) -> bytes:
+        fp = fingerprint(record)
+        row = self.rows.get(fp)
+        if row is not None:
+            row[1] += 1
+            return fp
+        self.rows[fp] = [record, 1]
+        if isinstance(record.get('type'), str):
+            relationships = self.overview.setdefault(record['node1'], {})
+            relationships.setdefault(f"{record['type']} {record['relationship']}", Counter())[record['node2']] += 1
+        return fp
+
+    def drop_row(self, fp:bytes):
+        row = self.rows[fp]
+        row[1] -= 1
+        if row[1] > 0:
+            return
+        record = self.rows.pop(fp)[0]
+        if isinstance(record.get('type'), str):
+            relationships = self.overview[record['node1']]
+            relationship = f"{record['type']} {record['relationship']}"
+            relationships[relationship][record['node2']] -= 1
+            if relationships[relationship][record['node2']] == 0:
+                del relationships[relationship][record['node2']]
+                if len(relationships[relationship]) == 0:
+                    del relationships[relationship]
+                    if len(relationships) == 0:
+                        del self.overview[record['node1']]
+
+    ### Edges
+
+    def add_edge(self, G, u, v, key, attrs:dict):
+        edge = (u, v, key)
+        if edge in self.edges:
+            self.drop_edge(edge)
+        company = attrs.get('file_number')
+        self.edges[edge] = ([ self.add_row(r) for r in edge_records(G, u, v, attrs) ], company)
+        self.node_edges.setdefault(u, set()).add(edge)
+        self.node_edges.setdefault(v, set()).add(edge)
+        if company is not None:
+            self.company_edges.setdefault(company, set()).add(edge)
+
+    def drop_edge(self, edge:tuple):
+        fps, company = self.edges.pop(edge)
+        for fp in fps:
+            self.drop_row(fp)
+        for n in edge[:2]:
+            self.node_edges.get(n, set()).discard(edge)
+        if company is not None:
+            self.company_edges[company].discard(edge)
+
+    def refresh_edges(self, G, edges):
+        for edge in list(edges):
+            u, v, key = edge
+            if G.has_edge(u, v, key):
+                self.add_edge(G, u, v, key, G.edges[u, v, key])
+            elif edge in self.edges:
+                self.drop_edge(edge)
+
+    ### Nodes
+
+    def drop_node(self, G, n):
+        self.nodes.pop(n, None)
+        for edge in list(self.node_edges.pop(n, ())):
+            if edge in self.edges:
+                self.drop_edge(edge)
+        # rows that named it as their company now show its id
+        self.refresh_edges(G, self.company_edges.get(n, ()))
+
+    def set_node(self, G, n):
+        old = self.nodes.get(n)
+        self.nodes[n] = node_record(G, n)
+        if old is None or old.get('label') != self.nodes[n].get('label'):
+            # rows that show this node's label, and rows that name it as their company
+            self.refresh_edges(G, self.node_edges.get(n, ()))
+            self.refresh_edges(G, self.company_edges.get(n, ()))
+
+    def node_edges_in(self, G, n) -> list:
+        return [ *G.in_edges(n, keys=True), *G.out_edges(n, keys=True) ]
+
+    def apply(self, G, delta:GraphDelta):
+        """Catch up with a change made to G in place. The model rebuilds if it was following another graph."""
+        if self.graph is not G:
+            self.rebuild(G)
+            return
+        for n in delta.nodes_removed:
+            self.drop_node(G, n)
+        touched = set()
+        for keep_node, merged_nodes in delta.merges:
+            for n in merged_nodes:
+                self.drop_node(G, n)
+            touched.add(keep_node)
+        for n in [ *delta.nodes_added, *delta.nodes_updated, *touched ]:
+            if n in G:
+                self.set_node(G, n)
+        for n in touched:
+            if n in G:
+                self.refresh_edges(G, self.node_edges_in(G, n))
+        for u, v, key in delta.edges_added:
+            if G.has_edge(u, v, key):
+                self.add_edge(G, u, v, key, G.edges[u, v, key])
+        self.graph = G
+        self.version += 1
+        self.frames = {}
+
+    ### Frames
+
+    def table(self, name:str) -> pd.DataFrame:
+        return { "nodes": self.node_frame, "edges": self.edge_frame, "overview": self.overview_frame }[name]()
+
+    def columns(self, name:str) -> list:
+        return list(self.table(name).columns)
+
+    def page(self, name:str, page:int, size:int, sort_by:str|None = None, descending:bool = False) -> tuple:
+        """One page of a table, sorted here rather than in the browser. Returns (rows, total rows).
+        Each sort order is kept until the next change, so paging through it is a slice."""
+        df = self.table(name)
+        if sort_by in df.columns:
+            df = self.frame(f"{name} by {sort_by}{' descending' if descending else ''}", lambda: df.sort_values(
+                sort_by, ascending=not descending, kind="stable", na_position="last",
+                key=lambda c: c.astype(str) if c.dtype == object else c
+            ))
+        start = max(0, (page - 1) * size)
+        return df.iloc[start:start + size], len(df)
+
+    def frame(self, name:str, make) -> pd.DataFrame:
+        if name not in self.frames:
+            self.frames[name] = make()
+        return self.frames[name]
+
+    def node_frame(self) -> pd.DataFrame:
+        return self.frame("nodes", lambda: ordered(
+            pd.DataFrame(list(self.nodes.values())), node_main_cols
+        ).sort_values(['type', 'label']))
+
+    def edge_frame(self) -> pd.DataFrame:
+        return self.frame("edges", lambda: ordered(
+            pd.DataFrame([ record for record, _ in self.rows.values() ], columns=edge_main_cols if len(self.rows) == 0 else None),
+            edge_main_cols
+        ))
+
+    def overview_frame(self) -> pd.DataFrame:
+        def make():
+            records = [
+                { "node1": node1, **{ r: "; ".join(sorted(map(str, c))) for r, c in relationships.items() } }
+                for node1, relationships in self.overview.items()
+            ]
+            df = pd.DataFrame(records, columns=["node1"] if len(records) == 0 else None)
+            df = df[[ "node1", *sorted(c for c in df.columns if c != "node1") ]]
+            return df.sort_values("node1").reset_index(drop=True).fillna('')
+        return self.frame("overview", make)
@@ -1,18 +1,41 @@
 import networkx as nx
 import msgspec
 import pandas as pd
-import usaddress 
-import probablepeople as pp 
-import requests 
 import msgspec 
 import json
+import re
 from business_class import Entity
+from delta import GraphDelta
+from dedupe import DuplicateIndex
+from parsing import parse_name, address_label, address_components
+from qng import add_graph, edge_key
+from fetch import run_concurrently, set_response_cache
+from cache import ResponseCache
+from backends import DatasetteBackend
+from mirror import LocalMirror
 from sodapy import Socrata
-from address_util import get_label
 import io 
+import os
+import weakref
+from adjacency import Adjacency
+from paths import find_paths
 
 endpoint = "https://companies-mvwuoztvlq-uc.a.run.app"
 
+# IL SOS responses are cached on disk between sessions; set RESPONSE_CACHE="" to turn this off
+response_cache_path = os.environ.get("RESPONSE_CACHE", ".cache/responses.sqlite")
+if response_cache_path:
+    set_response_cache(ResponseCache(response_cache_path))
+
+# point COMPANIES_MIRROR at a database made with mirror.build_mirror to work offline
+mirror_path = os.environ.get("COMPANIES_MIRROR", "")
+backend = LocalMirror(mirror_path) if mirror_path else DatasetteBackend(endpoint)
+
+
+def set_backend(new_backend):
+    global backend
+    backend = new_backend
+
 data_portal_url = "data.cityofchicago.org"
 client = Socrata(data_portal_url, None)
 
@@ -32,46 +55,53 @@ large_layout = {
 
 
 ### DATA FUNCTIONS ###
-def paginate(url):
-    items = []
-    while url:
-        response = requests.get(url)
-        try:
-            url = response.links.get("next").get("url")
-        except AttributeError:
-            url = None
-        items.extend(msgspec.json.decode(response.content))
-    return items
-
-
-def get_entities(field, search_values):
-    url = f"{endpoint}/companies/entities.json?_labels=on&_shape=array&{field}__in={json.dumps(search_values)}"
-    data = paginate(url)
-    return [ Entity(**d) for d in data ]
+def get_entities(field, search_values, page_size = None):
+    values = list(dict.fromkeys(search_values))
+    if len(values) == 0:
+        return []
+    return backend.entities_in(field, values, page_size=page_size)
 
 
-def get_companies(file_numbers:list):
-    url = f"{endpoint}/companies/entities.json?_labels=on&_shape=array&file_number__in={json.dumps(file_numbers)}&type__exact=company"
-    data = paginate(url)
-    return [ Entity(**d) for d in data ]
+def get_companies(file_numbers:list, page_size = None):
+    values = list(dict.fromkeys(file_numbers))
+    if len(values) == 0:
+        return []
+    return backend.entities_in("file_number", values, company_only=True, page_size=page_size)
 
 
 def get_name_ids(search_value):
-    url = f"{endpoint}/companies/names.json?_shape=array&name__like={search_value}"
-    data = paginate(url)
-    return [d['id'] for d in data]
+    return backend.name_ids(search_value)
 
 
 def get_address_ids(search_value): 
-    url = f"{endpoint}/companies/addresses.json?_shape=array&street__like={search_value}"
-    data = paginate(url)
-    return [d['id'] for d in data]
+    return backend.address_ids(search_value)
 
 
 def get_entities_by_file_number(search_value):
-    url = f"{endpoint}/companies/entities.json?_labels=on&_shape=array&file_number__like={search_value}"
-    data = paginate(url)
-    return [ Entity(**d) for d in data ]
+    return backend.entities_like("file_number", search_value)
+
+
+def search_entities(name_search:str, addr_search:str, file_number_search:str) -> list:
+    # independent lookups go out together; each later step waits only on the ids it needs
+    print("retrieving ids")
+    name_ids, address_ids, fn_entities = run_concurrently([
+        lambda: get_name_ids(name_search) if len(name_search) > 0 else [],
+        lambda: get_address_ids(addr_search) if len(addr_search) > 0 else [],
+        lambda: get_entities_by_file_number(file_number_search) if len(file_number_search) > 0 else [],
+    ])
+    print(name_ids, address_ids)
+
+    print("retrieving entities")
+    name_entities, addr_entities = run_concurrently([
+        lambda: get_entities('name_id', name_ids),
+        lambda: get_entities('address_id', address_ids),
+    ])
+    file_numbers = [e.file_number for e in name_entities] + [e.file_number for e in addr_entities]
+    fn_entities += get_entities("file_number", file_numbers)
+
+    combined = combine_entitity_list([name_entities, addr_entities, fn_entities])
+    print("entities:", len(combined))
+    return combined
 
 
 def clean_columns(df:pd.DataFrame)->pd.DataFrame:
@@ -85,38 +115,49 @@ def clean_columns(df:pd.DataFrame)->pd.DataFrame:
 
 ### GRAPH FUNCTIONS ###
 
-def graph_entities(G, gfs:dict, entities:list, merged:list):
-    G = nx.compose(G, gfs['company'].make_graphs([ e.company_dict() for e in entities ], "il_sos"))
-    G = nx.compose(G, gfs['name'].make_graphs([ e.name_dict() for e in entities ],"il_sos"))
-    G = nx.compose(G, gfs['address'].make_graphs([e.address_dict() for e in entities ], "il_sos"))   
-    G = nx.compose(G, gfs['links'].make_graphs([e.link_dict() for e in entities], "il_sos"))
+def graph_entities(G, gfs:dict, entities:list, merged:list) -> GraphDelta:
+    """Add entities to G in place and return a summary of what changed.
+    Junk names and addresses are dropped here, before they reach the graph."""
+    excluded = set()
+    add = lambda factory, rows: gfs[factory].add_to_graph(G, [ r for r in rows if r ], "il_sos", excluded_pattern, excluded)
+    delta = add('company', [ e.company_dict() for e in entities ])
+    delta.extend(add('name', [ e.name_dict() for e in entities ]))
+    delta.extend(add('address', [ e.address_dict() for e in entities ]))
+    delta.extend(add('links', [ e.link_dict() for e in entities ]))
+
+    # officers listed as e.g. "INVOLUNTARY DISSOLUTION" mean the company is no longer active.
+    # Their links are dropped, so make sure the company itself still comes in
+    inactive = { e.file_number for e in entities if e.name_id is not None and e.name_id.label and inactive_pattern.search(e.name_id.label) }
+    for n in inactive:
+        if n not in G:
+            G.add_node(n)
+            delta.nodes_added.append(n)
     
-    unlabeled = get_unlabeled_companies(G)
+    # companies only reached through a link come in without a label
+    unlabeled = get_unlabeled_companies(G, delta.nodes_added)
     while len(unlabeled) > 0:
         print(f"getting data for {len(unlabeled)} companies")
         companies = get_companies(unlabeled)
-        G = nx.compose(G, gfs['company'].make_graphs([ c.company_dict() for c in companies ], "il_sos"))
-        unlabeled = get_unlabeled_companies(G)
-
-    for m in merged: 
-        G = combine_nodes(G, m)
-    
-    excluded_nodes = get_excluded_nodes(G)
-    for en in excluded_nodes:
-        try:
-            if " DISSOLUTION" in G.nodes[en]['label'] or "REVOKED " in G.nodes[en]['label']:
-                for nbr in G.neighbors(en):
-                    if G.nodes[nbr]['type'] == "company":
-                        G.nodes[nbr]['type'] = "company (inactive)"
-                    
-            G.remove_node(en)    
-        except Exception as e:
-            print(e, en)
-            continue 
-
-    if len(G) > 0:
-        G = deduplicate_edges(G)
-    return G 
+        delta.extend(add('company', [ c.company_dict() for c in companies ]))
+        remaining = [ n for n in get_unlabeled_companies(G, unlabeled) if n not in excluded ]
+        if len(remaining) == len(unlabeled):
+            print(f"no company data for {remaining}")
+            break
+        unlabeled = remaining
+
+    # a company whose own name is excluded was already linked to before its name came back
+    dropped = [ n for n in delta.nodes_added if n in excluded and n in G ]
+    if len(dropped) > 0:
+        G.remove_nodes_from(dropped)
+        delta.nodes_added = [ n for n in delta.nodes_added if n not in excluded ]
+        delta.edges_added = [ e for e in delta.edges_added if e[0] not in excluded and e[1] not in excluded ]
+
+    for n in inactive:
+        if n in G and G.nodes[n].get('type') == "company":
+            G.nodes[n]['type'] = "company (inactive)"
+
+    delta.add_merges(combine_node_groups(G, merged))
+    return delta 
 
     
 
@@ -124,13 +165,13 @@ def get_excluded_nodes(G):
     return [ n[0] for n in G.nodes(data='label', default= "") if has_excluded_name(n[1]) ]
     
 
+excluded_labels = ["INVOLUNTARY", "VACANT", "VACATED", "SOLE OFFICER", "None", "SAME ", "REVOKED ", " DISSOLUTION", "UNACCEPTABLE ", "MERGED ", "WITHDRAWN"]
+excluded_pattern = re.compile("|".join(re.escape(e) for e in excluded_labels))
+inactive_pattern = re.compile(" DISSOLUTION|REVOKED ")
+
+
 def has_excluded_name(node_label:str):
-    excluded = ["INVOLUNTARY", "VACANT", "VACATED", "SOLE OFFICER", "None", "SAME ", "REVOKED ", " DISSOLUTION", "UNACCEPTABLE ", "MERGED ", "WITHDRAWN"]
-    for e in excluded:
-        if e in node_label:
-            return True 
-    # if no excluded terms are in the node label, return false 
-    return False 
+    return excluded_pattern.search(node_label) is not None
 
 
 def get_alias_ids(G, nodes:list):
@@ -144,129 +185,109 @@ def get_alias_ids(G, nodes:list):
     return full_list 
 
 
-def get_unlabeled_companies(G):
-    return [n for n in G.nodes if 'label' not in G.nodes[n].keys()]
+def get_unlabeled_companies(G, nodes = None):
+    nodes = G.nodes if nodes is None else [n for n in nodes if n in G]
+    return [n for n in nodes if 'label' not in G.nodes[n].keys()]
 
 
-def expand_nodes(nodes:list):
-    name_ids = []
-    file_numbers = []
-    address_ids = []
-    
-    for n in nodes:
-        
-        
-        match n:
-            case str(x) if x[:3] in ['LLC', 'COR']:
-                file_numbers.append(n) 
-            case str(x) if x[:1] == "A":
-                address_ids.append(n[1:])
-            case str(x) if x[:1] == "N":
-                name_ids.append(n[1:])
+def get_name_record(G:nx.MultiGraph, n):
+    """("company", record) or ("name", record) for a name node, or None if it can't be parsed"""
+    try:
+        name = G.nodes[n]['label'].replace('.', '').strip().upper()
+        parts = parse_name(name)
+    except Exception as e:
+        print(e, n)
+        return None
     
-    entities = get_entities('name_id', name_ids)
-    entities += get_entities('address_id', address_ids)
-    file_numbers += [e.file_number for e in entities]
-    entities += get_entities('file_number', file_numbers)
-    
-    return entities
+    if "CorporationName" in dict(parts).values():
+        parts = [p[0].replace(',', '').replace('.', '').upper() for p in parts]
+        return "company", {"node_id": n, "company_name": " ".join(parts)}
+    else:
+        record = {part[1]: part[0].replace(',', '').replace('.', '') for part in parts}
+        record["node_id"] = n
+        return "name", record
 
-     
-def expand_graph(G:nx.MultiGraph, node_list = []) ->list:
-    entities = []
-    node_ids = []
-    
-    if len(node_list) == 0:
-        node_list = list(G.nodes())
-    
-    print(f"expanding {len(node_list)} nodes")
-    node_ids = get_alias_ids(G, node_list)
-        
-    node_ids = list(set(node_ids))
-    segments = list(divide_list(node_ids, 100))
-    for s in segments:
-        entities += expand_nodes(list(set(node_ids)))        
-    return entities
-
-def divide_list(l, n):   
-    for i in range(0, len(l), n):  
-        yield l[i:i + n] 
-
-
-def extract_name_parts(G:nx.MultiGraph):
-    name_nodes = get_nodes_by_attribute(G, "tidy", "name")
-    names_parts = {}
-    for n in name_nodes:
-        try:
-            name = G.nodes[n]['label'].replace('.', '').strip().upper()
-            parts = pp.parse(name)
-            names_parts[n] = parts
-        except Exception as e:
-            print(e, n)
-            continue
-    
-    name_records = []
-    company_name_records = []
-    for name in names_parts:
-        parts = names_parts[name]
-        if "CorporationName" in dict(names_parts[name]).values():
-            parts = [p[0].replace(',', '').replace('.', '').upper() for p in parts]
-            company_name_records.append({"node_id": name, "company_name": " ".join(parts)})
-        else:
-            record = {part[1]: part[0].replace(',', '').replace('.', '') for part in parts}
-            record["node_id"] = name
-            name_records.append(record)  
-            
-    return pd.DataFrame(name_records).fillna(''), pd.DataFrame(company_name_records).fillna('')
+
+def get_street_record(G:nx.MultiGraph, n):
+    components = address_components(G.nodes[n].get('label', n))
+    if components is None:
+        print(G.nodes[n])
+        return None
+    return {"node_id": n, **components}
 
 
-def clean_streets(G: nx.MultiGraph):
+def get_street_records(G:nx.MultiGraph):
     street_nodes = get_nodes_by_attribute(G, "tidy", "address")
-    for sn in street_nodes:
-        raw = G.nodes[sn].get("label", sn)
-        label = get_label(raw)
-        G.nodes[sn]["label"] = label
-    return G 
+    records = [ get_street_record(G, n) for n in street_nodes ]
+    return [ r for r in records if r is not None ]
 
 
 def extract_street_parts(G:nx.MultiGraph):
-    street_nodes = get_nodes_by_attribute(G, "tidy", "address")
-    records = []
-    for n in street_nodes:
-        try:         
-            street = G.nodes[n]['label']
-            tags = usaddress.tag(street.upper())
-            records.append({"node_id": n, **tags[0]})
-        except Exception as e:
-            print(G.nodes[n])
-            continue
-    return pd.DataFrame(records).fillna('')
+    return pd.DataFrame(get_street_records(G)).fillna('')
 
 
 def get_ilsos_node(G, nodes:list):
     for n in nodes:
         if n in G:
-            if G.nodes[n]['data_source'] == "il_sos":
+            if G.nodes[n].get('data_source') == "il_sos":
                 return n 
 
 
-def combine_nodes(G, nodes:list):
-    nodes = sorted(nodes)
-    ilsos_node = get_ilsos_node(G, nodes)
-    keep_node = nodes[0] if ilsos_node is None else ilsos_node
-    merge_data = {}
-    
-    for n in nodes:
-        if n in G.nodes and n != keep_node:
-            merge_data[n] = G.nodes[n]
-            G = nx.identified_nodes(G, keep_node, n)
-            
-    if keep_node in G:
+def combine_nodes(G, nodes:list, copy=True):
+    if copy:
+        G = G.copy()
+    combine_node_groups(G, [nodes])
+    return G 
+
+
+def identify_node(G, keep_node, n):
+    """Fold n into keep_node in place, like nx.identified_nodes(G, keep_node, n)
+    except that edges keep_node already has are not doubled"""
+    n_data = G.nodes[n]
+    edges = [ (keep_node, keep_node if v == n else v, edge_key(d), d) for _, v, d in G.out_edges(n, data=True) ]
+    edges += [ (keep_node if u == n else u, keep_node, edge_key(d), d) for u, _, d in G.in_edges(n, data=True) ]
+    G.remove_node(n)
+    # an edge keep_node already has lands on the same key instead of being doubled
+    G.add_edges_from(edges)
+    contraction = G.nodes[keep_node].setdefault('contraction', {})
+    contraction[n] = n_data
+    return n_data
+
+
+def combine_node_groups(G, groups:list) -> list:
+    """Merge each group of nodes into one node, in place, rewiring edges as it goes.
+    Groups may overlap or name nodes an earlier group already merged away.
+    Returns (keep_node, merged_nodes) for every group that changed its keep node,
+    which can be a group that merged nothing but set its alias_ids."""
+    merged_into = {}
+
+    def resolve(n):
+        while n in merged_into:
+            n = merged_into[n]
+        return n
+
+    results = []
+    for group in groups:
+        nodes = sorted(group)
+        present = sorted(set(resolve(n) for n in nodes if resolve(n) in G))
+        if len(present) == 0:
+            continue
+        ilsos_node = get_ilsos_node(G, present)
+        keep_node = present[0] if ilsos_node is None else ilsos_node
+        merge_data = {}
+
+        for n in present:
+            if n != keep_node:
+                merge_data[n] = identify_node(G, keep_node, n)
+                merged_into[n] = keep_node
+
+        changed = len(merge_data) > 0 or G.nodes[keep_node].get('alias_ids') != nodes or "merge_data" not in G.nodes[keep_node]
         G.nodes[keep_node]['alias_ids'] = nodes
         md = G.nodes[keep_node]['merge_data'] if "merge_data" in G.nodes[keep_node].keys() else {}
         G.nodes[keep_node]['merge_data'] = { **md, **merge_data}
-        
-    return G 
+        if changed:
+            results.append((keep_node, list(merge_data)))
+    return results
 
 
 def get_node_names(G)->dict:
@@ -278,42 +299,130 @@ def get_node_names(G)->dict:
     return node_names
 
 
-def tidy_up(G):
-    G = clean_streets(G)
-    nf, cnf = extract_name_parts(G)
-    sr = extract_street_parts(G)
-    
-    nd = get_probable_duplicates(nf, ['GivenName', 'Surname', 'SuffixGenerational']) 
-    cnd = get_probable_duplicates(cnf, ['company_name'])
-    sd = get_probable_duplicates(sr, ['AddressNumber', 'StreetName', 'OccupancyIdentifier'])
-    duplicates = nd + cnd + sd 
-    
-    for d in duplicates:
-        G = combine_nodes(G, d)
-    return G    
+class NodeNames:
+    """get_node_names, kept up to date from graph deltas. Nodes that share a
+    label are all kept, and the one added last is the one the label names."""
+
+    def __init__(self):
+        self.labels = {}
+        self.named = {}
+
+    def rebuild(self, G):
+        self.__init__()
+        for n in G.nodes:
+            self.set_node(G, n)
+
+    def set_node(self, G, n):
+        self.drop_node(n)
+        label = G.nodes[n].get("label", n)
+        self.labels[n] = label
+        self.named.setdefault(label, {})[n] = None
+
+    def drop_node(self, n):
+        label = self.labels.pop(n, None)
+        if label is None:
+            return
+        nodes = self.named[label]
+        nodes.pop(n, None)
+        if len(nodes) == 0:
+            del self.named[label]
+
+    def apply(self, G, delta:GraphDelta):
+        for n in [ *delta.nodes_removed, *(n for _, merged_nodes in delta.merges for n in merged_nodes) ]:
+            if n not in G:
+                self.drop_node(n)
+        for n in [ *delta.nodes_added, *delta.nodes_updated, *(keep_node for keep_node, _ in delta.merges) ]:
+            if n in G:
+                self.set_node(G, n)
+
+    def names(self) -> dict:
+        return { label: next(reversed(nodes)) for label, nodes in self.named.items() }
+
+
+key_parts = {
+    "company": ['company_name'],
+    "name": ['GivenName', 'Surname', 'SuffixGenerational'],
+    "address": ['AddressNumber', 'StreetName', 'OccupancyIdentifier'],
+}
 
 
-def tidy_up_companies(G):
-    nf, cnf = extract_name_parts(G)
-    cnd = get_probable_duplicates(cnf, ['company_name'])
-    for d in cnd:
-        G = combine_nodes(G, d)
-    return G    
+# the kinds of key each tidy value can give; a name can turn out to be a company's
+tidy_kinds = {
+    "name": {"company", "name"},
+    "address": {"address"},
+}
+
 
+def get_node_keys(G, n) -> list:
+    """Blocking keys for one tidy-able node; nodes that share a key are probably the same"""
+    tidy = G.nodes[n].get('tidy')
+    if tidy == "name":
+        result = get_name_record(G, n)
+    elif tidy == "address":
+        record = get_street_record(G, n)
+        result = None if record is None else ("address", record)
+    else:
+        result = None
+    if result is None:
+        return []
 
-def get_probable_duplicates(df, grouping):
-    if len(df) == 0:
+    kind, record = result
+    key = tuple(record.get(p, '') for p in key_parts[kind])
+    # a record with none of the parts says nothing about what it duplicates
+    if all(k == '' for k in key):
         return []
+    return [(kind, *key)]
+
+
+def tidy_graph(G, index:DuplicateIndex, everything=False, delta:GraphDelta|None = None, nodes:list|None = None):
+    """Merge probable duplicates in place, parsing only the nodes that are new or relabeled
+    since the index last saw the graph. nodes, if given, are the only ones that can be;
+    otherwise every node is checked. Company names are always merged; people and addresses
+    only when everything is True. Relabeled nodes and merges are recorded in delta, if given."""
+    kinds = set(key_parts) if everything else {"company"}
+    widened = not kinds <= index.kinds
+    index.kinds = kinds
+
+    if widened or nodes is None:
+        candidates = G.nodes(data='tidy')
     else:
-        grouping = [g for g in grouping if g in df.columns]
-        probable_duplicates = (
-            df
-            .reset_index()
-            .groupby(grouping)
-            .agg({"node_id": ";".join, "index":"count"})
-            .pipe(lambda df: df[df['index'] > 1])
-        )
-        return [pd.split(';') for pd in list(probable_duplicates.node_id)]
+        candidates = [ (n, G.nodes[n].get('tidy')) for n in dict.fromkeys(nodes) if n in G ]
+    changed = []
+    for n, tidy in candidates:
+        # nodes that can't give a key of these kinds aren't parsed; widening kinds keys them later
+        if tidy is None or not tidy_kinds.get(tidy, set()) & kinds:
+            continue
+        label = G.nodes[n].get('label', n)
+        if not widened and index.is_current(n, (tidy, label)):
+            continue
+        if tidy == "address" and "address" in kinds:
+            label = address_label(label)
+            if delta is not None and label != G.nodes[n].get('label'):
+                delta.nodes_updated.append(n)
+            G.nodes[n]['label'] = label
+        index.set_keys(n, (tidy, label), get_node_keys(G, n))
+        changed.append(n)
+
+    if len(changed) == 0:
+        return G
+    duplicates = index.groups(list(index.signatures) if widened else changed, kinds, lambda n: n in G)
+
+    if len(duplicates) > 0:
+        merges = combine_node_groups(G, duplicates)
+        for keep_node, merged_nodes in merges:
+            for n in merged_nodes:
+                index.discard(n)
+        if delta is not None:
+            delta.add_merges(merges)
+    return G
+
+
+def tidy_up(G):
+    return tidy_graph(G, DuplicateIndex(), everything=True)
+
+
+def tidy_up_companies(G):
+    return tidy_graph(G, DuplicateIndex())
 
 
 def combine_entitity_list(entity_lists:list):
@@ -331,74 +440,98 @@ def get_nodes_by_attribute(G: nx.MultiGraph, key:str, filter_value:str) -> list:
     return [ n[0] for n in node_attributes if n[1] == filter_value ]
 
 
+node_reserved = {
+    "company": "black", 
+    "address": "#f9cf13",
+    "name": "#dd0f04",
+}
+edge_reserved = {
+    "manager": "#e515ed",
+    "agent": "#00c3dd",  
+    "address": "#adadad",
+    "company": "black", 
+    "president": "#7a15ed", 
+    "secretary": "#2937f4" 
+}
+palette = [
+    '#1b9e77',
+    '#d95f02',
+    '#7570b3',
+    '#e7298a',
+    '#66a61e',
+    '#e6ab02',
+    '#a6761d',
+    '#666666',
+    '#666666',
+    '#666666'
+]
+
+
+class GraphTypes:
+    """The node and edge types a graph has used, in the order they first appeared,
+    for colors that stay put as the graph changes. Types are only ever added;
+    one that is no longer in the graph just keeps its color."""
+
+    def __init__(self):
+        self.node_types = {}
+        self.edge_types = {}
+
+    def rebuild(self, G):
+        self.__init__()
+        self.add_nodes(G, G.nodes)
+        self.add_edges(G, G.edges(keys=True))
+
+    def add_nodes(self, G, nodes):
+        for n in nodes:
+            t = G.nodes[n].get('type')
+            if t is not None:
+                self.node_types.setdefault(t, None)
+
+    def add_edges(self, G, edges):
+        for u, v, key in edges:
+            t = G.edges[u, v, key].get('type')
+            if t is not None:
+                self.edge_types.setdefault(t, None)
+
+    def apply(self, G, delta:GraphDelta):
+        self.add_nodes(G, [ n for n in [ *delta.nodes_added, *delta.nodes_updated, *(k for k, _ in delta.merges) ] if n in G ])
+        self.add_edges(G, [ (u, v, key) for u, v, key in delta.edges_added if G.has_edge(u, v, key) ])
+
+    def colors(self) -> tuple:
+        return get_colormap(list(self.node_types), palette, node_reserved), get_colormap(list(self.edge_types), palette, edge_reserved)
+
+
 def get_colors(G):
-    node_reserved = {
-        "company": "black", 
-        "address": "#f9cf13",
-        "name": "#dd0f04",
-    }
-    edge_reserved = {
-        "manager": "#e515ed",
-        "agent": "#00c3dd",  
-        "address": "#adadad",
-        "company": "black", 
-        "president": "#7a15ed", 
-        "secretary": "#2937f4" 
-    }
-    colors = [
-        '#1b9e77',
-        '#d95f02',
-        '#7570b3',
-        '#e7298a',
-        '#66a61e',
-        '#e6ab02',
-        '#a6761d',
-        '#666666',
-        '#666666',
-        '#666666'
-        ]
-    
-    node_types = [t for t in set(dict(G.nodes(data="type", default=None)).values()) if t is not None]
-    edge_types = set()
-    for (u, v, k, c) in G.edges(data='type', keys=True, default=None):
-        if c is not None:
-            edge_types.add(c)
-    edge_types = list(edge_types)
-    node_colors = get_colormap(node_types, colors, node_reserved)
-    edge_colors = get_colormap(edge_types, colors, edge_reserved)
-    return node_colors, edge_colors 
+    types = GraphTypes()
+    types.rebuild(G)
+    return types.colors()
 
 
 def get_colormap(types, colors, reserved):
     colormap = {}
     for count, t in enumerate(types):
-        colormap[t] = reserved.get(t, colors[count])
+        colormap[t] = reserved.get(t, colors[count % len(colors)])
     return colormap 
 
 
-def deduplicate_edges(G):
-    records = [ {"source": edge[0], "target": edge[1], **edge[2]} for edge in G.edges(data=True) ]
-    df = pd.DataFrame(records).drop_duplicates()
-    source = df.source
-    target = df.target
-    attr = df.drop(columns=["source", "target"]).to_dict('records')
-    G.clear_edges()
-    G.add_edges_from(zip(source, target, attr))
-    return G    
+def get_connected_nodes(G, node) -> set:
+    """Every node that can reach node, ignoring edge direction"""
+    if node not in G:
+        return set()
+    return nx.node_connected_component(G.to_undirected(as_view=True), node)
 
-    
-def get_connected_nodes(G, node, nbrhood:dict = {}) -> dict:
-    graph = G.to_undirected(as_view=True)
-    if node in graph:
-        nbrs = nx.neighbors(graph, node)
-        nbrhood[node] = nbrs
-        for n in nbrs:
-            if n not in nbrhood:
-                nbrhood.update(get_connected_nodes(graph, n, nbrhood))
-        return nbrhood
-    else:
-        return nbrhood 
 
+# adjacency snapshots of session graphs for path searches; each goes away with its graph
+adjacencies = weakref.WeakKeyDictionary()
+
+def get_adjacency(G, version:int|None = None) -> Adjacency:
+    """version is the graph's version, for a graph changed in place; a snapshot taken at another one is retaken"""
+    made_for = (version, len(G), G.number_of_edges())
+    adjacency, made = adjacencies.get(G, (None, None))
+    if adjacency is None or made != made_for:
+        adjacency = Adjacency.from_networkx(G)
+        adjacencies[G] = (adjacency, made_for)
+    return adjacency
 
 
 def get_node_label(G, node):
@@ -562,12 +695,17 @@ def search_data_portal(keywords:list, resource_id:str = 'rsxa-ify5', prefix:str
 
 
 ### Path graph    
-def get_path_graph(G, node_1, node_2):
-    path_nodes = set()
-    shortest_paths = list(nx.all_shortest_paths(G.to_undirected(as_view=True), node_1, node_2))
-    for path in shortest_paths:
-        path_nodes.update(path)
-    return nx.induced_subgraph(G, list(path_nodes))
+def get_path_graph(G, node_1, node_2, k:int|None = None, max_length:int|None = None, version:int|None = None) -> tuple:
+    """A copy of the subgraph of G on the paths between node_1 and node_2, and the PathResult behind it"""
+    result = find_paths(get_adjacency(G, version), node_1, node_2, k, max_length)
+    return G.subgraph(list(result.nodes)).copy(), result
+
+
+def remove_nodes(G, nodes) -> GraphDelta:
+    """Remove nodes from G in place"""
+    present = [ n for n in dict.fromkeys(nodes) if n in G ]
+    G.remove_nodes_from(present)
+    return GraphDelta(nodes_removed=present)
 
 
 